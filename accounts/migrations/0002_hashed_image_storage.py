@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:59
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='profile_photo',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentHashStorage(), upload_to='profiles/'),
+        ),
+    ]
@@ -5,6 +5,9 @@ import uuid
 from django.conf import settings
 from datetime import timedelta
 
+from core.storage import image_storage
+from core.utils import save_with_unique_slug
+
 
 class UserManager(BaseUserManager):
 	
@@ -21,15 +24,7 @@ class UserManager(BaseUserManager):
 		else:
 			base_username = phone_number
 		
-		username = base_username.strip().lower()
-		
-		counter = 1
-		while self.model.objects.filter(username=username).exists():
-			username = f"{base_username}{counter}"
-			counter += 1
-		
 		user = self.model(
-			username=username ,
 			email=email ,
 			phone_number=phone_number ,
 			**extra_fields
@@ -39,7 +34,11 @@ class UserManager(BaseUserManager):
 			raise ValueError("Password is required.")
 		
 		user.set_password(password)
-		user.save(using=self._db)
+		# First free of base, base1, base2, ... in one query, retried on a race
+		save_with_unique_slug(
+			user , base_username.strip().lower() , lambda: user.save(using=self._db) ,
+			field="username" , separator=""
+		)
 		return user
 	
 	def create_superuser(self , email , phone_number , password , **extra_fields):
@@ -63,7 +62,7 @@ class User(AbstractBaseUser , PermissionsMixin):
 	pincode = models.CharField(max_length=10 , blank=True , null=True)
 	state = models.CharField(max_length=50 , blank=True , null=True)
 	country = models.CharField(max_length=50 , blank=True , null=True)
-	profile_photo = models.ImageField(upload_to="profiles/" , blank=True , null=True)
+	profile_photo = models.ImageField(upload_to="profiles/" , storage=image_storage , blank=True , null=True)
 	date_of_birth = models.DateField(blank=True , null=True)
 	
 	is_active = models.BooleanField(default=True)
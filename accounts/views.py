@@ -11,6 +11,7 @@ from .serializers import (UserRegistrationSerializer , UserLoginSerializer , Use
                           RegistrationOTPSerializer)
 
 from .renderers import UserRenderer
+from core.guest_cart import merge_guest_cart
 
 def get_tokens(user):
     refresh = RefreshToken.for_user(user)
@@ -33,6 +34,7 @@ class UserRegistrationView(APIView):
         user = serializer.save()
 
         token = get_tokens(user)
+        merge_guest_cart(user, request.data.get("guest_cart"))
         return Response(
             {"msg": "Registration successful", "token": token},
             status=status.HTTP_201_CREATED,
@@ -53,6 +55,7 @@ class UserLoginView(APIView):
 
         if user:
             token = get_tokens(user)
+            merge_guest_cart(user, request.data.get("guest_cart"))
             return Response(
                 {"msg": "Login successful", "token": token},
                 status=status.HTTP_200_OK,
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 from environ import Env
+from django.core.exceptions import ImproperlyConfigured
 
 # ---------------------------------------------------------
 # BASE CONFIG
@@ -109,10 +110,37 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Write transactions take the lock up front instead of failing on upgrade
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+            # A file rather than shared-cache memory, so concurrent test
+            # connections wait for locks instead of erroring out
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
 
+# ---------------------------------------------------------
+# CACHE (LocMem for local; production requires a shared CACHE_URL, e.g. redis://)
+# ---------------------------------------------------------
+
+CACHES = {
+    "default": env.cache("CACHE_URL") if IS_PRODUCTION else env.cache("CACHE_URL", default="locmemcache://"),
+}
+
+# Workers coordinate through the cache (catalog generation and ETags,
+# stampede locks, search index versions, guest carts), so a per-process
+# backend would let them disagree
+if IS_PRODUCTION and CACHES["default"]["BACKEND"].endswith((".LocMemCache", ".DummyCache")):
+    raise ImproperlyConfigured("CACHE_URL must point to a cache shared by all workers in production.")
+
+# Seconds a cached catalog response lives; edits invalidate it earlier
+CATALOG_CACHE_TIMEOUT = env.int("CATALOG_CACHE_TIMEOUT", default=60 * 60)
+
+# Seconds an anonymous visitor's cart survives without a change; guest carts
+# live only in the cache
+GUEST_CART_TIMEOUT = env.int("GUEST_CART_TIMEOUT", default=7 * 24 * 60 * 60)
+
+
 # ---------------------------------------------------------
 # PASSWORD VALIDATION
 # ---------------------------------------------------------
@@ -163,6 +191,14 @@ MEDIA_ROOT = BASE_DIR / "media"
 CKEDITOR_UPLOAD_PATH = "uploads/"
 
 
+# ---------------------------------------------------------
+# REACT FRONTEND
+# ---------------------------------------------------------
+
+# `npm run build` output; served from memory by core.views.ReactAppView (see core.spa)
+REACT_BUILD_DIR = env("REACT_BUILD_DIR", default=str(BASE_DIR / "frontend" / "build"))
+
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
@@ -14,11 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
 from django.conf import settings
 from django.urls import path, re_path, include
 from django.conf.urls.static import static
 
+from core.storage import HASHED_DIR, serve_hashed_media
+from core.views import ReactAppView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include("core.urls")),
@@ -27,4 +32,18 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
+    # Content-addressed uploads (core.storage) are served as immutable
+    urlpatterns += [
+        re_path(
+            r"^%s%s/(?P<path>.*)$" % (settings.MEDIA_URL.lstrip("/"), HASHED_DIR),
+            serve_hashed_media,
+            {"document_root": settings.MEDIA_ROOT},
+        ),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# The React app answers every other path once it has been built
+if os.path.isdir(settings.REACT_BUILD_DIR):
+    urlpatterns += [
+        re_path(r"^(?!api/|admin/|ckeditor/|media/)(?P<path>.*)$", ReactAppView.as_view(), name="react"),
+    ]
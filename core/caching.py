@@ -0,0 +1,232 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count , Max
+from django.utils.cache import get_conditional_response , patch_cache_control
+from django.utils.http import http_date , quote_etag
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from .models import Category , SubCategory
+
+GENERATION_KEY = "catalog:generation"
+MODIFIED_KEY = "catalog:modified"
+TREE_KEY = "catalog:category-tree"
+
+# While one worker computes a cold key the others wait for its result
+# instead of all hitting the database at once.
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+
+def shared_counter(key):
+	"""
+	A counter kept in the shared cache. A missing key is seeded from the
+	clock (in microseconds) rather than 1, so after a cache restart or
+	eviction it never repeats a value that already stood for something else.
+	"""
+	value = cache.get(key)
+	if value is None:
+		cache.add(key , time.time_ns() // 1000 , timeout=None)
+		value = cache.get(key)
+	return value
+
+
+def bump_shared_counter(key):
+	try:
+		return cache.incr(key)
+	except ValueError:
+		shared_counter(key)
+		return cache.incr(key)
+
+
+def catalog_generation():
+	return shared_counter(GENERATION_KEY)
+
+
+def bump_catalog_generation():
+	"""
+	Invalidate every cached catalog response at once: old keys are never read
+	again and simply expire.
+	"""
+	bump_shared_counter(GENERATION_KEY)
+	cache.set(MODIFIED_KEY , int(time.time()) , timeout=None)
+
+
+def catalog_last_modified():
+	return cache.get(MODIFIED_KEY)
+
+
+def response_cache_key(request):
+	params = sorted(
+		(name , sorted(values))
+		for name , values in request.query_params.lists()
+	)
+	# Absolute URL, since pagination links in the cached data embed the host
+	url = request.build_absolute_uri(request.path)
+	digest = hashlib.sha1(f"{url}?{params}".encode()).hexdigest()
+	return f"catalog:{catalog_generation()}:{digest}"
+
+
+def cached_response(request , compute , timeout=None):
+	"""
+	Return the cached response data for this request, or build it with
+	`compute()` and cache it when it is a 200.
+	"""
+	if timeout is None:
+		timeout = settings.CATALOG_CACHE_TIMEOUT
+
+	key = response_cache_key(request)
+	cached = cache.get(key)
+	if cached is not None:
+		return Response(cached , headers={"X-Cache": "HIT"})
+
+	lock_key = f"{key}:lock"
+	locked = cache.add(lock_key , 1 , timeout=LOCK_TIMEOUT)
+	if not locked:
+		deadline = time.monotonic() + LOCK_WAIT
+		while time.monotonic() < deadline:
+			time.sleep(LOCK_POLL_INTERVAL)
+			cached = cache.get(key)
+			if cached is not None:
+				return Response(cached , headers={"X-Cache": "HIT"})
+
+	try:
+		response = compute()
+		if response.status_code == 200:
+			cache.set(key , response.data , timeout=timeout)
+		response["X-Cache"] = "MISS"
+		return response
+	finally:
+		if locked:
+			cache.delete(lock_key)
+
+
+def conditional_response(request , etag , last_modified , compute):
+	"""
+	Answer If-None-Match / If-Modified-Since with a 304 before `compute()`
+	runs; otherwise stamp the fresh response with its validators.
+	"""
+	not_modified = get_conditional_response(request._request , etag=etag , last_modified=last_modified)
+	if not_modified is not None:
+		return not_modified
+
+	response = compute()
+	if response.status_code == 200:
+		response["ETag"] = etag
+		if last_modified is not None:
+			response["Last-Modified"] = http_date(last_modified)
+		# Let browsers keep the body but always revalidate it
+		patch_cache_control(response , no_cache=True)
+	return response
+
+
+def build_category_tree():
+	"""
+	Category -> subcategory menu with product counts, from two queries.
+	"""
+	categories = {
+		category["id"]: {**category , "product_count": 0 , "subcategories": []}
+		for category in Category.objects.order_by("name").values("id" , "name" , "slug")
+	}
+	subcategories = (
+		SubCategory.objects
+		.order_by("name")
+		.values("id" , "name" , "slug" , "category_id")
+		.annotate(product_count=Count("products"))
+	)
+	for subcategory in subcategories:
+		category = categories[subcategory.pop("category_id")]
+		category["subcategories"].append(subcategory)
+		category["product_count"] += subcategory["product_count"]
+	return list(categories.values())
+
+
+def category_tree():
+	"""
+	Return (etag, json bytes) for the category tree, building it on a miss.
+	The blob lives until invalidate_category_tree() is called.
+	"""
+	cached = cache.get(TREE_KEY)
+	if cached is None:
+		blob = json.dumps(build_category_tree() , separators=("," , ":")).encode()
+		cached = (quote_etag(hashlib.sha1(blob).hexdigest()[:16]) , blob)
+		cache.set(TREE_KEY , cached , timeout=None)
+	return cached
+
+
+def invalidate_category_tree():
+	cache.delete(TREE_KEY)
+
+
+def category_tree_response(request):
+	etag , blob = category_tree()
+	return conditional_response(
+		request , etag , None ,
+		lambda: HttpResponse(blob , content_type="application/json")
+	)
+
+
+class CatalogCacheMixin:
+	"""
+	Cache list/detail responses of read-only catalog viewsets until the
+	catalog generation changes (see the signal handlers in core.signals).
+	The generation also serves as a strong ETag, so unchanged resources
+	get a 304 without touching the database.
+	"""
+
+	def list(self , request , *args , **kwargs):
+		return self.catalog_response(request , lambda: super(CatalogCacheMixin , self).list(request , *args , **kwargs))
+
+	def retrieve(self , request , *args , **kwargs):
+		return self.catalog_response(request , lambda: super(CatalogCacheMixin , self).retrieve(request , *args , **kwargs))
+
+	def catalog_response(self , request , compute , cached=True):
+		"""
+		With `cached=False`, `compute()` does its own caching and only the
+		conditional GET handling is added.
+		"""
+		etag = quote_etag(f"{catalog_generation()}-{request.accepted_renderer.format}")
+		return conditional_response(
+			request , etag , catalog_last_modified() ,
+			(lambda: cached_response(request , compute)) if cached else compute
+		)
+
+
+class ModifiedConditionalMixin:
+	"""
+	Conditional GET for per-user viewsets: validators come from the newest
+	`last_modified_field` and the row count, read with one aggregate query.
+	"""
+	last_modified_field = "updated_at"
+
+	def list(self , request , *args , **kwargs):
+		stats = self.filter_queryset(self.get_queryset()).aggregate(
+			last_modified=Max(self.last_modified_field) ,
+			count=Count("pk")
+		)
+		return self.modified_response(
+			request , stats["last_modified"] , stats["count"] ,
+			lambda: super(ModifiedConditionalMixin , self).list(request , *args , **kwargs)
+		)
+
+	def retrieve(self , request , *args , **kwargs):
+		instance = self.get_object()
+		last_modified = instance
+		for part in self.last_modified_field.split("__"):
+			last_modified = getattr(last_modified , part)
+		return self.modified_response(
+			request , last_modified , 1 ,
+			lambda: Response(self.get_serializer(instance).data)
+		)
+
+	def modified_response(self , request , last_modified , count , compute):
+		stamp = last_modified.timestamp() if last_modified else 0
+		etag = quote_etag(f"{stamp:.6f}-{count}-{request.accepted_renderer.format}")
+		return conditional_response(
+			request , etag , int(stamp) if last_modified else None , compute
+		)
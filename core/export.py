@@ -0,0 +1,91 @@
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import Product , ProductImage
+
+EXPORT_CHUNK_SIZE = 1000
+
+PRODUCT_COLUMNS = [
+	"id" , "name" , "slug" , "strength" , "packing" , "form" , "country" ,
+	"base_price" , "selling_price" , "discount_percentage" ,
+	"bestseller" , "prescription_required" , "stock" , "available" ,
+	"excerpt" , "created_at" , "updated_at" ,
+]
+
+encoder = DjangoJSONEncoder(separators=("," , ":") , ensure_ascii=False)
+
+
+def export_queryset(queryset=None):
+	"""
+	Products with every relation the export reads, in primary key order.
+	Relations are fetched per iterator chunk, so memory stays flat.
+	"""
+	if queryset is None:
+		queryset = Product.objects.all()
+	return (
+		queryset
+		.select_related(None)
+		.prefetch_related(None)
+		.select_related("brand" , "manufacturer" , "subcategory__category")
+		.prefetch_related(
+			"salt_compositions" ,
+			Prefetch("images" , queryset=ProductImage.objects.order_by("pk")) ,
+		)
+		.order_by("pk")
+	)
+
+
+def product_record(product):
+	record = {column: getattr(product , column) for column in PRODUCT_COLUMNS}
+	record.update({
+		# Sanitized HTML stored on save (see RenderedRichTextModel)
+		**{field: product.rendered_html.get(field) for field in Product.richtext_fields} ,
+		"brand": product.brand and {
+			"id": product.brand.id ,
+			"name": product.brand.name ,
+			"slug": product.brand.slug ,
+		} ,
+		"manufacturer": product.manufacturer and {
+			"id": product.manufacturer.id ,
+			"name": product.manufacturer.name ,
+		} ,
+		"subcategory": product.subcategory and {
+			"id": product.subcategory.id ,
+			"name": product.subcategory.name ,
+			"slug": product.subcategory.slug ,
+			"category": {
+				"id": product.subcategory.category.id ,
+				"name": product.subcategory.category.name ,
+				"slug": product.subcategory.category.slug ,
+			} ,
+		} ,
+		"salt_compositions": [
+			{"id": salt.id , "name": salt.name , "strength": salt.strength}
+			for salt in product.salt_compositions.all()
+		] ,
+		"images": [image.image.url for image in product.images.all() if image.image] ,
+	})
+	return record
+
+
+def iter_ndjson(queryset=None , chunk_size=EXPORT_CHUNK_SIZE):
+	"""
+	Yield the catalog as NDJSON, one encoded line per product.
+	"""
+	for product in export_queryset(queryset).iterator(chunk_size=chunk_size):
+		yield (encoder.encode(product_record(product)) + "\n").encode()
+
+
+def gzip_stream(chunks , level=6):
+	"""
+	Gzip an iterable of bytes on the fly, yielding compressed blocks as the
+	compressor fills them.
+	"""
+	compressor = zlib.compressobj(level , zlib.DEFLATED , zlib.MAX_WBITS | 16)
+	for chunk in chunks:
+		block = compressor.compress(chunk)
+		if block:
+			yield block
+	yield compressor.flush()
@@ -0,0 +1,100 @@
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case , When , Value , Count , IntegerField
+
+from .caching import catalog_generation
+
+# Selling price buckets as [min, max); the last one is open ended
+PRICE_BUCKETS = [(0 , 500) , (500 , 1000) , (1000 , 5000) , (5000 , 10000) , (10000 , None)]
+
+# facet -> (value column, label column)
+FACET_COLUMNS = {
+	"brand": ("brand__slug" , "brand__name") ,
+	"subcategory": ("subcategory__slug" , "subcategory__name") ,
+	"category": ("subcategory__category__slug" , "subcategory__category__name") ,
+	"form": ("form" , "form") ,
+	"prescription_required": ("prescription_required" , "prescription_required") ,
+}
+
+# Params that page or shape the results without changing the matching set
+NON_FILTER_PARAMS = {"page" , "cursor" , "ordering" , "fields" , "expand" , "facets"}
+
+
+def price_bucket():
+	whens = [
+		When(selling_price__gte=low , selling_price__lt=high , then=Value(index))
+		if high is not None else
+		When(selling_price__gte=low , then=Value(index))
+		for index , (low , high) in enumerate(PRICE_BUCKETS)
+	]
+	return Case(*whens , default=None , output_field=IntegerField())
+
+
+def compute_facets(queryset):
+	"""
+	Count every facet for `queryset` with one GROUP BY over all facet columns;
+	the per-facet totals are summed from the grouped rows.
+	"""
+	columns = list(dict.fromkeys(column for pair in FACET_COLUMNS.values() for column in pair))
+	rows = (
+		queryset
+		.order_by()
+		.annotate(price_bucket=price_bucket())
+		.values(*columns , "price_bucket")
+		.annotate(count=Count("pk"))
+	)
+
+	counts = defaultdict(lambda: defaultdict(int))
+	labels = {}
+	for row in rows:
+		for facet , (value_column , label_column) in FACET_COLUMNS.items():
+			value = row[value_column]
+			if value is None or value == "":
+				continue
+			counts[facet][value] += row["count"]
+			labels[(facet , value)] = row[label_column]
+		if row["price_bucket"] is not None:
+			counts["price"][row["price_bucket"]] += row["count"]
+
+	facets = {
+		facet: sorted(
+			(
+				{"value": value , "label": labels[(facet , value)] , "count": count}
+				for value , count in counts[facet].items()
+			) ,
+			key=lambda item: (-item["count"] , str(item["label"]))
+		)
+		for facet in FACET_COLUMNS
+	}
+	facets["price"] = [
+		{"min": low , "max": high , "count": counts["price"][index]}
+		for index , (low , high) in enumerate(PRICE_BUCKETS)
+		if counts["price"][index]
+	]
+	return facets
+
+
+def facet_cache_key(request):
+	params = sorted(
+		(name , sorted(values))
+		for name , values in request.query_params.lists()
+		if name not in NON_FILTER_PARAMS
+	)
+	digest = hashlib.sha1(repr(params).encode()).hexdigest()
+	return f"catalog:{catalog_generation()}:facets:{digest}"
+
+
+def product_facets(request , queryset):
+	"""
+	Facet counts for the filtered product queryset, cached per filter
+	signature until the catalog changes.
+	"""
+	key = facet_cache_key(request)
+	facets = cache.get(key)
+	if facets is None:
+		facets = compute_facets(queryset)
+		cache.set(key , facets , timeout=settings.CATALOG_CACHE_TIMEOUT)
+	return facets
@@ -18,6 +18,25 @@ class ProductFilter(django_filters.FilterSet):
         lookup_expr="iexact"
     )
 
+    # ?discount_min=20&discount_max=50 (uses the available/discount_percentage index)
+    discount = django_filters.RangeFilter(
+        field_name="discount_percentage"
+    )
+
+    # ?price_min=500&price_max=1000, matching the price facet buckets
+    price = django_filters.RangeFilter(
+        field_name="selling_price"
+    )
+
+    form = django_filters.CharFilter(
+        field_name="form",
+        lookup_expr="iexact"
+    )
+
+    prescription_required = django_filters.BooleanFilter(
+        field_name="prescription_required"
+    )
+
     class Meta:
         model = Product
-        fields = ["category", "subcategory", "brand"]
+        fields = ["category", "subcategory", "brand", "discount", "price", "form", "prescription_required"]
@@ -0,0 +1,52 @@
+import re
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Cart
+
+# Carts of anonymous visitors live in the cache, not the cart table, under
+# an unguessable token the client keeps; they expire after
+# GUEST_CART_TIMEOUT seconds without a write.
+TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{22}$")
+
+
+def new_token():
+	return secrets.token_urlsafe(16)
+
+
+def cache_key(token):
+	return f"guest-cart:{token}"
+
+
+def load(token):
+	"""
+	The guest cart as {product_id: quantity}, or None when unknown or expired.
+	"""
+	if not isinstance(token , str) or not TOKEN_PATTERN.match(token):
+		return None
+	return cache.get(cache_key(token))
+
+
+def save(token , lines):
+	lines = {product_id: quantity for product_id , quantity in lines.items() if quantity}
+	cache.set(cache_key(token) , lines , timeout=settings.GUEST_CART_TIMEOUT)
+	return lines
+
+
+def delete(token):
+	cache.delete(cache_key(token))
+
+
+def merge_guest_cart(user , token):
+	"""
+	Move a guest cart into the user's Cart rows (see CartQuerySet.merge) and
+	drop it. Called when login or registration issues tokens.
+	"""
+	lines = load(token)
+	if not lines:
+		return 0
+	merged = Cart.objects.merge(user , lines)
+	delete(token)
+	return merged
@@ -0,0 +1,142 @@
+import base64
+from io import BytesIO
+
+import django
+from django.apps import apps
+from django.core.files.base import ContentFile
+from PIL import Image , ImageOps
+
+# Longest edge of each variant; images are never upscaled
+VARIANT_SIZES = {
+	"thumb": 160 ,
+	"card": 480 ,
+	"zoom": 1600 ,
+}
+
+# extension -> (Pillow format, save options)
+VARIANT_FORMATS = {
+	"webp": ("WEBP" , {"quality": 80 , "method": 4}) ,
+	"jpeg": ("JPEG" , {"quality": 82 , "optimize": True , "progressive": True}) ,
+}
+
+# Inline placeholder: a blurred-up 16px WebP sent as a data URI
+LQIP_SIZE = 16
+LQIP_QUALITY = 40
+
+
+def encode(image , extension):
+	format , options = VARIANT_FORMATS[extension]
+	if format == "JPEG" and image.mode != "RGB":
+		# No alpha in JPEG: flatten transparent logos onto white
+		background = Image.new("RGB" , image.size , (255 , 255 , 255))
+		background.paste(image , mask=image.getchannel("A") if "A" in image.getbands() else None)
+		image = background
+	buffer = BytesIO()
+	image.save(buffer , format , **options)
+	return buffer.getvalue()
+
+
+def open_image(storage , name):
+	"""
+	Load a stored image upright, as RGB or RGBA.
+	"""
+	with storage.open(name , "rb") as source:
+		image = Image.open(source)
+		image = ImageOps.exif_transpose(image)
+		return image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+
+def generate_variants(storage , name , original=None):
+	"""
+	Write every size/format derivative of the stored image `name` and return
+	{"source": name, size: {"width", "height", extension: stored name}}.
+	
+	`storage` names files by content (ContentHashStorage), so only the
+	extension of the name passed to save() matters, and regenerating an
+	unchanged variant reuses the stored file.
+	"""
+	if original is None:
+		original = open_image(storage , name)
+	
+	variants = {"source": name}
+	for size , edge in VARIANT_SIZES.items():
+		image = original.copy()
+		image.thumbnail((edge , edge) , Image.LANCZOS)
+		variant = {"width": image.width , "height": image.height}
+		for extension in VARIANT_FORMATS:
+			variant[extension] = storage.save(f"{size}.{extension}" , ContentFile(encode(image , extension)))
+		variants[size] = variant
+	return variants
+
+
+def dominant_color(image):
+	"""
+	Most common colour of the image as #rrggbb, from a 5-colour quantization.
+	"""
+	small = image.convert("RGB")
+	small.thumbnail((64 , 64))
+	quantized = small.quantize(colors=5)
+	count , index = max(quantized.getcolors())
+	red , green , blue = quantized.getpalette()[index * 3:index * 3 + 3]
+	return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def lqip(image):
+	small = image.copy()
+	small.thumbnail((LQIP_SIZE , LQIP_SIZE))
+	buffer = BytesIO()
+	small.save(buffer , "WEBP" , quality=LQIP_QUALITY)
+	return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def image_metadata(image):
+	"""
+	What a client needs before the image loads: its size, to reserve the box,
+	and a dominant colour and tiny inline preview to paint into it.
+	"""
+	return {
+		"width": image.width ,
+		"height": image.height ,
+		"dominant_color": dominant_color(image) ,
+		"lqip": lqip(image) ,
+	}
+
+
+EMPTY_METADATA = {"width": None , "height": None , "dominant_color": "" , "lqip": ""}
+
+
+def refresh_variants(field_file , metadata=False):
+	"""
+	Variants for an ImageField value, or {} when the field is empty; with
+	`metadata`, returns (variants, image_metadata) from one decode.
+	"""
+	if not field_file:
+		return ({} , EMPTY_METADATA) if metadata else {}
+	original = open_image(field_file.storage , field_file.name)
+	variants = generate_variants(field_file.storage , field_file.name , original)
+	return (variants , image_metadata(original)) if metadata else variants
+
+
+def variant_urls(variants , storage , request=None):
+	"""
+	Serializer representation of stored variants: {size: {width, height, webp, jpeg}}.
+	"""
+	urls = {}
+	for size in VARIANT_SIZES:
+		variant = variants.get(size)
+		if not variant:
+			continue
+		urls[size] = {"width": variant["width"] , "height": variant["height"]}
+		for extension in VARIANT_FORMATS:
+			url = storage.url(variant[extension])
+			urls[size][extension] = request.build_absolute_uri(url) if request is not None else url
+	return urls
+
+
+def init_worker():
+	"""
+	Process pool initializer for the backfill commands: spawned workers
+	start without Django, forked ones already have it.
+	"""
+	if not apps.ready:
+		django.setup()
@@ -0,0 +1,304 @@
+import csv
+import gzip
+import json
+import re
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction , DatabaseError
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Brand , Manufacturer , SubCategory , SaltComposition , Product
+from .caching import bump_catalog_generation , invalidate_category_tree
+from .search import refresh_search
+from .utils import allocate_slugs
+
+IMPORT_BATCH_SIZE = 500
+
+# Plain columns a row may set; anything else in the file is ignored
+IMPORT_FIELDS = [
+	"name" , "strength" , "packing" , "form" , "country" ,
+	"base_price" , "selling_price" , *Product.richtext_fields ,
+	"bestseller" , "prescription_required" , "stock" , "available" ,
+]
+RELATION_FIELDS = ["brand" , "manufacturer" , "subcategory"]
+
+TRUE_VALUES = {"1" , "true" , "t" , "yes" , "y"}
+FALSE_VALUES = {"0" , "false" , "f" , "no" , "n"}
+
+# "Paracetamol (500mg)", the SaltComposition.__str__ format
+SALT_PATTERN = re.compile(r"^(?P<name>.*?)\s*(?:\((?P<strength>[^()]*)\))?$")
+
+
+def open_rows(path , format=None):
+	"""
+	Yield (line number, row dict) from a CSV or NDJSON file, gzipped or not.
+	"""
+	if format is None:
+		format = "ndjson" if re.search(r"\.(nd)?jsonl?(\.gz)?$" , path) else "csv"
+	opener = gzip.open if path.endswith(".gz") else open
+	with opener(path , "rt" , encoding="utf-8" , newline="") as stream:
+		if format == "csv":
+			reader = csv.DictReader(stream)
+			for row in reader:
+				yield reader.line_num , row
+		else:
+			for line_num , line in enumerate(stream , start=1):
+				if not line.strip():
+					continue
+				try:
+					row = json.loads(line)
+				except ValueError as error:
+					row = error
+				yield line_num , row
+
+
+def salt_key(name , strength):
+	return (" ".join((name or "").lower().split()) , "".join((strength or "").lower().split()))
+
+
+class RowError(Exception):
+	def __init__(self , errors):
+		super().__init__(errors)
+		self.errors = errors
+
+
+class CatalogImporter:
+	"""
+	Upsert products from rows in batches: references are resolved from
+	in-memory maps loaded once, and every batch is written with one slug
+	allocation query, one bulk_create, one bulk_update and one salts
+	rewrite inside a transaction.
+	Rows carrying a known `slug` update that product; others are created.
+	On update rows a blank cell leaves the field as it is.
+	"""
+
+	def __init__(self , batch_size=IMPORT_BATCH_SIZE , create_missing=False):
+		self.batch_size = batch_size
+		self.create_missing = create_missing
+		self.created = self.updated = 0
+		self.errors = []
+		# Product ids written, for the search index refresh at the end
+		self.touched = set()
+		self.load_maps()
+
+	def load_maps(self):
+		self.brands = {}
+		for pk , name , slug in Brand.objects.values_list("pk" , "name" , "slug"):
+			self.brands.setdefault(name.lower() , pk)
+			self.brands[slug] = pk
+		self.manufacturers = {}
+		for pk , name in Manufacturer.objects.order_by("pk").values_list("pk" , "name"):
+			self.manufacturers.setdefault(name.lower() , pk)
+		self.subcategories = dict(SubCategory.objects.values_list("slug" , "pk"))
+		self.salts = {}
+		for pk , name , strength in SaltComposition.objects.order_by("pk").values_list("pk" , "name" , "strength"):
+			self.salts.setdefault(salt_key(name , strength) , pk)
+
+	def run(self , rows):
+		started = time.monotonic()
+		total = 0
+		batch = []
+		for line_num , row in rows:
+			total += 1
+			batch.append((line_num , row))
+			if len(batch) >= self.batch_size:
+				self.write_batch(batch)
+				batch = []
+		if batch:
+			self.write_batch(batch)
+
+		if self.created or self.updated:
+			bump_catalog_generation()
+			invalidate_category_tree()
+			# Bulk writes send no signals, so the search indexes are told here;
+			# brands and salts made by --create-missing go through save()
+			refresh_search(product_ids=self.touched , names=[("product" , pk) for pk in self.touched])
+		elapsed = time.monotonic() - started
+		return {
+			"rows": total ,
+			"created": self.created ,
+			"updated": self.updated ,
+			"failed": len(self.errors) ,
+			"seconds": round(elapsed , 3) ,
+			"rows_per_second": round(total / elapsed , 1) if elapsed else None ,
+		}
+
+	def write_batch(self , batch):
+		try:
+			with transaction.atomic():
+				self.write(batch)
+		except DatabaseError:
+			# References created inside the rolled back transaction are gone too
+			self.load_maps()
+			# Find the offending rows by writing the batch one row at a time
+			for item in batch:
+				try:
+					with transaction.atomic():
+						self.write([item])
+				except DatabaseError as error:
+					self.errors.append(self.error_entry(*item , {"__all__": [str(error)]}))
+
+	def write(self , batch):
+		existing = Product.objects.in_bulk(
+			[row["slug"] for _ , row in batch if isinstance(row , dict) and row.get("slug")] ,
+			field_name="slug"
+		)
+		to_create , to_update , update_fields , salts = [] , [] , set() , []
+		errors = []
+		for line_num , row in batch:
+			try:
+				if not isinstance(row , dict):
+					raise RowError({"__all__": [f"Invalid row: {row}"]})
+				product = existing.get(row.get("slug") or None)
+				values , salt_ids = self.clean_row(row , creating=product is None)
+			except RowError as error:
+				errors.append(self.error_entry(line_num , row , error.errors))
+				continue
+
+			if product is None:
+				product = Product(**values)
+				product.slug = slugify(row.get("slug") or values["name"])
+				to_create.append(product)
+			else:
+				for field , value in values.items():
+					setattr(product , field , value)
+				update_fields.update(values)
+				to_update.append(product)
+			if salt_ids is not None:
+				salts.append((product , salt_ids))
+
+		if to_create:
+			# Slugs for the whole batch from one query
+			slugs = allocate_slugs(Product , [product.slug for product in to_create])
+			for product , slug in zip(to_create , slugs):
+				product.slug = slug
+			Product.objects.bulk_create(to_create)
+		if to_update:
+			now = timezone.now()
+			for product in to_update:
+				product.updated_at = now
+			Product.objects.bulk_update(to_update , [*update_fields , "updated_at"])
+		if salts:
+			self.write_salts({product.slug: salt_ids for product , salt_ids in salts})
+
+		self.touched.update(product.pk for product in to_update)
+		created_ids = [product.pk for product in to_create]
+		if None in created_ids:
+			# bulk_create does not return primary keys on every backend
+			created_ids = Product.objects.filter(
+				slug__in=[product.slug for product in to_create]
+			).values_list("pk" , flat=True)
+		self.touched.update(created_ids)
+
+		self.errors += errors
+		self.created += len(to_create)
+		self.updated += len(to_update)
+
+	def write_salts(self , salts):
+		# bulk_create does not return primary keys on every backend
+		ids = dict(Product.objects.filter(slug__in=list(salts)).values_list("slug" , "pk"))
+		through = Product.salt_compositions.through
+		through.objects.filter(product_id__in=ids.values()).delete()
+		through.objects.bulk_create([
+			through(product_id=ids[slug] , saltcomposition_id=salt_id)
+			for slug , salt_ids in salts.items()
+			for salt_id in salt_ids
+		])
+		Product.objects.filter(pk__in=ids.values()).refresh_salt_signatures()
+
+	def clean_row(self , row , creating):
+		"""
+		Return (field values, salt ids or None) for a row, or raise RowError
+		with every problem found.
+		"""
+		values , errors = {} , {}
+		for name in IMPORT_FIELDS:
+			if name not in row:
+				continue
+			field = Product._meta.get_field(name)
+			value = row[name]
+			if value == "" and not creating:
+				continue
+			if value is None or value == "":
+				if field.null:
+					values[name] = None
+				continue
+			if field.get_internal_type() == "BooleanField" and isinstance(value , str):
+				lowered = value.strip().lower()
+				value = True if lowered in TRUE_VALUES else False if lowered in FALSE_VALUES else value
+			try:
+				values[name] = field.clean(value , None)
+			except ValidationError as error:
+				errors[name] = error.messages
+		if creating and not values.get("name"):
+			errors["name"] = ["This field is required."]
+
+		for name in RELATION_FIELDS:
+			if name not in row or (row[name] == "" and not creating):
+				continue
+			try:
+				values[f"{name}_id"] = self.resolve(name , row[name])
+			except RowError as error:
+				errors.update(error.errors)
+
+		salt_ids = None
+		salts = row.get("salt_compositions" , row.get("salts"))
+		if salts == "" and not creating:
+			salts = None
+		if salts is not None:
+			try:
+				salt_ids = self.resolve_salts(salts)
+			except RowError as error:
+				errors.update(error.errors)
+
+		if errors:
+			raise RowError(errors)
+		return values , salt_ids
+
+	def resolve(self , name , value):
+		if value is None or value == "":
+			return None
+		if isinstance(value , dict):
+			keys = [value.get("slug") , (value.get("name") or "").lower()]
+		else:
+			keys = [str(value).strip() , str(value).strip().lower()]
+
+		lookup = {"brand": self.brands , "manufacturer": self.manufacturers , "subcategory": self.subcategories}[name]
+		for key in keys:
+			if key and key in lookup:
+				return lookup[key]
+
+		label = value.get("name") if isinstance(value , dict) else str(value).strip()
+		if self.create_missing and name in ("brand" , "manufacturer") and label:
+			model = Brand if name == "brand" else Manufacturer
+			pk = model.objects.create(name=label).pk
+			lookup[label.lower()] = pk
+			return pk
+		raise RowError({name: [f"Unknown {name}: {label or value}"]})
+
+	def resolve_salts(self , value):
+		if isinstance(value , str):
+			value = [part for part in value.split("|") if part.strip()]
+		if not isinstance(value , list):
+			raise RowError({"salt_compositions": ["Must be a list or a |-separated string."]})
+
+		salt_ids = []
+		for salt in value:
+			if isinstance(salt , dict):
+				name , strength = salt.get("name") , salt.get("strength")
+			else:
+				match = SALT_PATTERN.match(str(salt).strip())
+				name , strength = match["name"] , match["strength"]
+			key = salt_key(name , strength)
+			if key not in self.salts:
+				if not (self.create_missing and key[0]):
+					raise RowError({"salt_compositions": [f"Unknown salt: {name} ({strength or ''})"]})
+				self.salts[key] = SaltComposition.objects.create(name=name.strip() , strength=strength or None).pk
+			salt_ids.append(self.salts[key])
+		return list(dict.fromkeys(salt_ids))
+
+	@staticmethod
+	def error_entry(line_num , row , errors):
+		return {"line": line_num , "row": row if isinstance(row , dict) else None , "errors": errors}
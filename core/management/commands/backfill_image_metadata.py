@@ -0,0 +1,68 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor , as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections , transaction
+
+from core.caching import bump_catalog_generation
+from core.images import image_metadata , init_worker , open_image
+from core.models import ProductImage
+
+METADATA_FIELDS = ["width" , "height" , "dominant_color" , "lqip"]
+
+
+def measure(name):
+	storage = ProductImage._meta.get_field("image").storage
+	try:
+		return name , image_metadata(open_image(storage , name)) , None
+	except OSError as error:
+		return name , None , str(error)
+
+
+class Command(BaseCommand):
+	help = "Fill in width, height, dominant colour and LQIP placeholders for product images."
+	
+	def add_arguments(self , parser):
+		parser.add_argument("--workers" , type=int , default=None , help="Worker processes; one per CPU by default.")
+		parser.add_argument("--batch-size" , type=int , default=500 , help="Rows written per transaction.")
+		parser.add_argument("--force" , action="store_true" , help="Recompute images that already have metadata.")
+	
+	def handle(self , *args , **options):
+		queryset = ProductImage.objects.exclude(image__isnull=True).exclude(image="")
+		if not options["force"]:
+			queryset = queryset.filter(width__isnull=True)
+		
+		# Rows sharing a file are measured once
+		pending = defaultdict(list)
+		for pk , name in queryset.values_list("pk" , "image").order_by("pk"):
+			pending[name].append(pk)
+		if not pending:
+			self.stdout.write("Nothing to do.")
+			return
+		
+		# Workers only read storage; results are written back from here
+		connections.close_all()
+		done , failed , updates = 0 , 0 , []
+		with ProcessPoolExecutor(max_workers=options["workers"] , initializer=init_worker) as pool:
+			futures = [pool.submit(measure , name) for name in pending]
+			for future in as_completed(futures):
+				name , metadata , error = future.result()
+				if error:
+					failed += len(pending[name])
+					self.stderr.write(f"{name}: {error}")
+					continue
+				updates += [ProductImage(pk=pk , **metadata) for pk in pending[name]]
+				if len(updates) >= options["batch_size"]:
+					done += self.write(updates)
+					updates = []
+		done += self.write(updates)
+		
+		if done:
+			bump_catalog_generation()
+		self.stdout.write(self.style.SUCCESS(f"{done} images measured, {failed} failed"))
+	
+	def write(self , updates):
+		if updates:
+			with transaction.atomic():
+				ProductImage.objects.bulk_update(updates , METADATA_FIELDS)
+		return len(updates)
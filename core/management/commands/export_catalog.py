@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core.export import EXPORT_CHUNK_SIZE , iter_ndjson , gzip_stream
+
+
+class Command(BaseCommand):
+	help = "Write the product catalog as NDJSON (one product per line)."
+	
+	def add_arguments(self , parser):
+		parser.add_argument("-o" , "--output" , help="File to write; stdout by default.")
+		parser.add_argument("--gzip" , action="store_true" , help="Gzip the output.")
+		parser.add_argument("--chunk-size" , type=int , default=EXPORT_CHUNK_SIZE)
+	
+	def handle(self , *args , **options):
+		chunks = iter_ndjson(chunk_size=options["chunk_size"])
+		if options["gzip"]:
+			chunks = gzip_stream(chunks)
+		
+		output = options["output"]
+		stream = open(output , "wb") if output else sys.stdout.buffer
+		try:
+			for chunk in chunks:
+				stream.write(chunk)
+		finally:
+			if output:
+				stream.close()
+			else:
+				stream.flush()
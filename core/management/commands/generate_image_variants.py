@@ -0,0 +1,84 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor , as_completed
+
+from django.apps import apps
+from django.core.management.base import BaseCommand , CommandError
+from django.db import connections , transaction
+
+from core.caching import bump_catalog_generation
+from core.images import generate_variants , init_worker
+from core.models import Brand , ProductImage
+
+# name -> (model, image field, variants field)
+SOURCES = {
+	"products": (ProductImage , "image" , "variants") ,
+	"brands": (Brand , "logo" , "logo_variants") ,
+}
+
+
+def render(label , field , name):
+	storage = apps.get_model(label)._meta.get_field(field).storage
+	try:
+		return name , generate_variants(storage , name) , None
+	except OSError as error:
+		return name , None , str(error)
+
+
+class Command(BaseCommand):
+	help = "Generate missing thumb/card/zoom WebP and JPEG variants for stored images."
+	
+	def add_arguments(self , parser):
+		parser.add_argument("sources" , nargs="*" , metavar="source" ,
+			help=f"What to process ({', '.join(SOURCES)}); everything by default.")
+		parser.add_argument("--workers" , type=int , default=None , help="Worker processes; one per CPU by default.")
+		parser.add_argument("--batch-size" , type=int , default=200 , help="Rows written per transaction.")
+		parser.add_argument("--force" , action="store_true" , help="Regenerate variants that already exist.")
+	
+	def handle(self , *args , **options):
+		unknown = set(options["sources"]) - set(SOURCES)
+		if unknown:
+			raise CommandError(f"Unknown source(s): {', '.join(sorted(unknown))}")
+		
+		total = 0
+		for source in options["sources"] or SOURCES:
+			total += self.backfill(*SOURCES[source] , options)
+		if total:
+			bump_catalog_generation()
+	
+	def backfill(self , model , field , variants_field , options):
+		rows = model._base_manager.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+		# Rows sharing a file share its variants, which are rendered once
+		pending = defaultdict(list)
+		for pk , name , variants in rows.values_list("pk" , field , variants_field).order_by("pk"):
+			if options["force"] or (variants or {}).get("source") != name:
+				pending[name].append(pk)
+		label = model._meta.verbose_name_plural
+		if not pending:
+			self.stdout.write(f"{label}: nothing to do")
+			return 0
+		
+		# Workers only touch storage; results are written back from here
+		connections.close_all()
+		done , failed , updates = 0 , 0 , []
+		with ProcessPoolExecutor(max_workers=options["workers"] , initializer=init_worker) as pool:
+			futures = [pool.submit(render , model._meta.label , field , name) for name in pending]
+			for future in as_completed(futures):
+				name , variants , error = future.result()
+				if error:
+					failed += len(pending[name])
+					self.stderr.write(f"{label} {name}: {error}")
+					continue
+				updates += [model(pk=pk , **{variants_field: variants}) for pk in pending[name]]
+				if len(updates) >= options["batch_size"]:
+					done += self.write(model , variants_field , updates)
+					updates = []
+		done += self.write(model , variants_field , updates)
+		
+		self.stdout.write(self.style.SUCCESS(f"{label}: {done} processed, {failed} failed"))
+		return done
+	
+	def write(self , model , variants_field , updates):
+		if updates:
+			with transaction.atomic():
+				model._base_manager.bulk_update(updates , [variants_field])
+		return len(updates)
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand , CommandError
+
+from core.importer import IMPORT_BATCH_SIZE , CatalogImporter , open_rows
+
+
+class Command(BaseCommand):
+	help = (
+		"Create or update products from a CSV or NDJSON file (optionally gzipped). "
+		"Rows with a known slug update that product, the rest are created. "
+		"brand/manufacturer/subcategory take a slug or name; salts are "
+		"'Name (strength)' entries separated by '|', or a list in NDJSON. "
+		"Blank cells on update rows leave the field unchanged."
+	)
+	
+	def add_arguments(self , parser):
+		parser.add_argument("path")
+		parser.add_argument("--format" , choices=["csv" , "ndjson"] , help="Guessed from the file name by default.")
+		parser.add_argument("--batch-size" , type=int , default=IMPORT_BATCH_SIZE)
+		parser.add_argument("--errors" , help="Where to write rejected rows (NDJSON); defaults to <path>.errors.ndjson.")
+		parser.add_argument("--create-missing" , action="store_true" , help="Create unknown brands, manufacturers and salts.")
+	
+	def handle(self , *args , **options):
+		if options["batch_size"] < 1:
+			raise CommandError("--batch-size must be at least 1.")
+		
+		importer = CatalogImporter(batch_size=options["batch_size"] , create_missing=options["create_missing"])
+		try:
+			report = importer.run(open_rows(options["path"] , options["format"]))
+		except (OSError , UnicodeDecodeError) as error:
+			raise CommandError(f"Could not read {options['path']}: {error}")
+		
+		self.stdout.write(
+			f"{report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/sec): "
+			f"{report['created']} created, {report['updated']} updated, {report['failed']} failed"
+		)
+		if importer.errors:
+			errors_path = options["errors"] or f"{options['path']}.errors.ndjson"
+			with open(errors_path , "w" , encoding="utf-8") as stream:
+				for entry in importer.errors:
+					stream.write(json.dumps(entry , default=str) + "\n")
+			self.stdout.write(self.style.WARNING(f"Rejected rows written to {errors_path}"))
+		else:
+			self.stdout.write(self.style.SUCCESS("All rows imported."))
@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.caching import bump_catalog_generation
+from core.models import Brand , ProductImage
+from core.storage import HASHED_DIR
+
+
+def sources():
+	# (model, image field, variants field or None)
+	return [
+		(ProductImage , "image" , "variants") ,
+		(Brand , "logo" , "logo_variants") ,
+		(get_user_model() , "profile_photo" , None) ,
+	]
+
+
+class Command(BaseCommand):
+	help = (
+		"Move existing ProductImage, Brand logo and profile photo files into "
+		"content-addressed storage, sharing one file between identical images, "
+		"and report the bytes reclaimed."
+	)
+	
+	def add_arguments(self , parser):
+		parser.add_argument("--batch-size" , type=int , default=500 , help="Rows updated per transaction.")
+		parser.add_argument("--keep-originals" , action="store_true" , help="Leave the old files in place.")
+		parser.add_argument("--dry-run" , action="store_true" , help="Only report what would change.")
+	
+	def handle(self , *args , **options):
+		self.dry_run = options["dry_run"]
+		self.legacy = FileSystemStorage()
+		self.moved = {}  # old name -> hashed name
+		self.old_bytes = self.new_bytes = 0
+		self.new_names = set()
+		
+		rows = missing = 0
+		for model , field , variants_field in sources():
+			migrated , skipped = self.migrate(model , field , variants_field , options["batch_size"])
+			rows += migrated
+			missing += skipped
+		
+		reclaimed = self.old_bytes - self.new_bytes
+		if not (self.dry_run or options["keep_originals"]):
+			for name in self.moved:
+				self.legacy.delete(name)
+		elif options["keep_originals"]:
+			reclaimed = 0
+		if rows and not self.dry_run:
+			bump_catalog_generation()
+		
+		prefix = "Would migrate" if self.dry_run else "Migrated"
+		self.stdout.write(self.style.SUCCESS(
+			f"{prefix} {rows} rows: {len(self.moved)} files -> {len(self.new_names)} unique, "
+			f"{missing} missing, {reclaimed} bytes reclaimed"
+		))
+	
+	def migrate(self , model , field , variants_field , batch_size):
+		storage = model._meta.get_field(field).storage
+		columns = ["pk" , field] + ([variants_field] if variants_field else [])
+		queryset = model._base_manager.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+		
+		updates , migrated , missing = [] , 0 , 0
+		for row in queryset.values_list(*columns).order_by("pk").iterator():
+			pk , name = row[0] , row[1]
+			if name.startswith(f"{HASHED_DIR}/"):
+				continue
+			if name not in self.moved:
+				if not self.legacy.exists(name):
+					missing += 1
+					self.stderr.write(f"{model._meta.verbose_name} {pk}: {name} is missing")
+					continue
+				self.moved[name] = self.store(storage , name)
+			
+			values = {field: self.moved[name]}
+			if variants_field and row[2] and row[2].get("source") == name:
+				# The variants were rendered from these same bytes
+				values[variants_field] = {**row[2] , "source": self.moved[name]}
+			updates.append(model(pk=pk , **values))
+			migrated += 1
+			if len(updates) >= batch_size:
+				self.write(model , updates , columns[1:])
+				updates = []
+		self.write(model , updates , columns[1:])
+		return migrated , missing
+	
+	def store(self , storage , name):
+		with self.legacy.open(name , "rb") as source:
+			content = File(source , name)
+			hashed = storage.hashed_name(name , content)
+			self.old_bytes += content.size
+			if hashed not in self.new_names and not storage.exists(hashed):
+				self.new_bytes += content.size
+			self.new_names.add(hashed)
+			if not self.dry_run:
+				storage.save(name , content)
+		return hashed
+	
+	def write(self , model , updates , fields):
+		if updates and not self.dry_run:
+			with transaction.atomic():
+				model._base_manager.bulk_update(updates , fields)
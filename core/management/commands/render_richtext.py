@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand , CommandError
+from django.db import transaction
+
+from core.caching import bump_catalog_generation
+from core.models import Brand , Manufacturer , SaltComposition , Product
+
+MODELS = {
+	"brand": Brand ,
+	"manufacturer": Manufacturer ,
+	"saltcomposition": SaltComposition ,
+	"product": Product ,
+}
+
+
+class Command(BaseCommand):
+	help = "Re-render the stored HTML, plain text and excerpt of RichText fields."
+	
+	def add_arguments(self , parser):
+		parser.add_argument("models" , nargs="*" , metavar="model" ,
+			help=f"Models to backfill ({', '.join(MODELS)}); all of them by default.")
+		parser.add_argument("--batch-size" , type=int , default=500)
+	
+	def handle(self , *args , **options):
+		batch_size = options["batch_size"]
+		unknown = set(options["models"]) - set(MODELS)
+		if unknown:
+			raise CommandError(f"Unknown model(s): {', '.join(sorted(unknown))}")
+		rendered = 0
+		for name in options["models"] or MODELS:
+			model = MODELS[name]
+			total = self.backfill(model , batch_size)
+			rendered += total
+			self.stdout.write(self.style.SUCCESS(f"{model._meta.verbose_name_plural}: {total} rendered"))
+		if rendered:
+			# bulk_update sends no signals: expire cached responses with the old HTML
+			bump_catalog_generation()
+	
+	def backfill(self , model , batch_size):
+		fields = ["pk" , *model.richtext_fields]
+		total , last_pk = 0 , 0
+		while True:
+			# Keyset batches, each rendered and written in its own transaction
+			batch = list(model.objects.only(*fields).filter(pk__gt=last_pk).order_by("pk")[:batch_size])
+			if not batch:
+				return total
+			for obj in batch:
+				obj.render_richtext()
+			with transaction.atomic():
+				# Plain manager method: skips ProductQuerySet.bulk_update's re-render
+				model._base_manager.bulk_update(batch , model.RENDERED_FIELDS)
+			total += len(batch)
+			last_pk = batch[-1].pk
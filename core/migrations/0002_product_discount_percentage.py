@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:43
+
+from django.db import migrations, models
+from django.db.models import Case, When, F, FloatField, ExpressionWrapper
+
+
+def populate_discount_percentage(apps, schema_editor):
+    Product = apps.get_model("core", "Product")
+    Product.objects.update(
+        discount_percentage=Case(
+            When(
+                base_price__gt=0,
+                then=ExpressionWrapper(
+                    (F("base_price") - F("selling_price")) * 100.0 / F("base_price"),
+                    output_field=FloatField(),
+                ),
+            ),
+            default=None,
+            output_field=FloatField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_percentage',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_discount_percentage, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'discount_percentage'], name='product_avail_discount_idx'),
+        ),
+    ]
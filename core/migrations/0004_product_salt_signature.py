@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:49
+
+import hashlib
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def populate_salt_signatures(apps, schema_editor):
+    Product = apps.get_model("core", "Product")
+    salts = defaultdict(set)
+    rows = Product.salt_compositions.through.objects.values_list(
+        "product_id", "saltcomposition__name", "saltcomposition__strength"
+    )
+    for product_id, name, strength in rows:
+        salts[product_id].add((
+            " ".join((name or "").lower().split()),
+            "".join((strength or "").lower().split()),
+        ))
+
+    by_signature = defaultdict(list)
+    for product_id, canonical in salts.items():
+        by_signature[hashlib.sha1(repr(sorted(canonical)).encode()).hexdigest()].append(product_id)
+    for signature, ids in by_signature.items():
+        Product.objects.filter(pk__in=ids).update(salt_signature=signature)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_product_updated_at_datetime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='salt_signature',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.RunPython(populate_salt_signatures, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['salt_signature', 'selling_price'], name='product_salt_sig_price_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:59
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='brand',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentHashStorage(), upload_to='brands/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentHashStorage(), upload_to='products/'),
+        ),
+    ]
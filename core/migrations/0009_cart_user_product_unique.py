@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_lines(apps, schema_editor):
+    # Fold repeated (user, product) lines into the oldest one before the constraint
+    Cart = apps.get_model("core", "Cart")
+    duplicates = (
+        Cart.objects.values("user_id", "product_id")
+        .annotate(lines=Count("id"), keep=Min("id"), total=Sum("quantity"))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        Cart.objects.filter(pk=row["keep"]).update(quantity=row["total"])
+        Cart.objects.filter(user_id=row["user_id"], product_id=row["product_id"]).exclude(pk=row["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_image_metadata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_user_product_unique'),
+        ),
+    ]
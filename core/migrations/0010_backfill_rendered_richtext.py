@@ -0,0 +1,43 @@
+from django.db import migrations
+
+from core.richtext import render_fields
+
+# richtext_fields of each RenderedRichTextModel when this migration was written
+RICHTEXT_FIELDS = {
+    "Brand": ("description",),
+    "Manufacturer": ("address",),
+    "SaltComposition": ("description",),
+    "Product": ("description", "uses", "benefits", "side_effects", "dosage", "storage"),
+}
+
+BATCH_SIZE = 500
+
+
+def render_existing_rows(apps, schema_editor):
+    """
+    Fill rendered_html, plain_text and excerpt for rows saved before they
+    existed, and re-render the rest with the current allowlist.
+    """
+    for model_name, fields in RICHTEXT_FIELDS.items():
+        model = apps.get_model("core", model_name)
+        batch = []
+        for obj in model.objects.only("pk", *fields).order_by("pk").iterator(chunk_size=BATCH_SIZE):
+            obj.rendered_html, obj.plain_text, obj.excerpt = render_fields(
+                {field: getattr(obj, field) for field in fields}
+            )
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ["rendered_html", "plain_text", "excerpt"])
+                batch = []
+        model.objects.bulk_update(batch, ["rendered_html", "plain_text", "excerpt"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_cart_user_product_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(render_existing_rows, migrations.RunPython.noop),
+    ]
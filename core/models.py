@@ -1,20 +1,65 @@
-from django.db import models
+import hashlib
+from collections import defaultdict
+
+from django.db import models , transaction , connections , IntegrityError
+from django.db.models import (
+	Case , When , F , Value , FloatField , DecimalField , ExpressionWrapper , Subquery , OuterRef ,
+	Count , Sum , Window ,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 from django.conf import settings
 from ckeditor.fields import RichTextField
 
+from .richtext import render_fields
+from .utils import save_with_unique_slug
+from .storage import image_storage
+
 
 # Create your models here.
 
+class RenderedRichTextModel(models.Model):
+	"""
+	Renders the RichText fields named in `richtext_fields` on save: sanitized
+	HTML per field, the combined plain text (search, snippets) and a short
+	excerpt, so API reads serve stored output as is.
+	"""
+	richtext_fields = ()
+	
+	rendered_html = models.JSONField(default=dict , blank=True , editable=False)
+	plain_text = models.TextField(blank=True , default="" , editable=False)
+	excerpt = models.CharField(max_length=255 , blank=True , default="" , editable=False)
+	
+	RENDERED_FIELDS = ("rendered_html" , "plain_text" , "excerpt")
+	
+	def render_richtext(self):
+		self.rendered_html , self.plain_text , self.excerpt = render_fields(
+			{field: getattr(self , field) for field in self.richtext_fields}
+		)
+	
+	def save(self , *args , **kwargs):
+		update_fields = kwargs.get("update_fields")
+		if update_fields is None:
+			self.render_richtext()
+		elif set(self.richtext_fields).intersection(update_fields):
+			self.render_richtext()
+			kwargs["update_fields"] = {*update_fields , *self.RENDERED_FIELDS}
+		super().save(*args , **kwargs)
+	
+	class Meta:
+		abstract = True
+
+
 class Category(models.Model):
 	name = models.CharField(max_length=150 , unique=True)
 	slug = models.SlugField(unique=True , blank=True)
 	
 	def save(self , *args , **kwargs):
-		if not self.slug:
-			self.slug = slugify(self.name)
-		super().save(*args , **kwargs)
+		if self.slug:
+			return super().save(*args , **kwargs)
+		save_with_unique_slug(self , slugify(self.name) , lambda: super(Category , self).save(*args , **kwargs))
 	
 	def __str__(self):
 		return self.name
@@ -29,16 +74,10 @@ class SubCategory(models.Model):
 	slug = models.SlugField(unique=True , blank=True)
 	
 	def save(self , *args , **kwargs):
-		if not self.slug:
-			base_slug = slugify(self.name)
-			# Make slug unique within same category
-			slug = base_slug
-			counter = 1
-			while SubCategory.objects.filter(category=self.category , slug=slug).exclude(pk=self.pk).exists():
-				slug = f"{base_slug}-{counter}"
-				counter += 1
-			self.slug = slug
-		super().save(*args , **kwargs)
+		if self.slug:
+			return super().save(*args , **kwargs)
+		# slug is unique across all categories, not just within this one
+		save_with_unique_slug(self , slugify(self.name) , lambda: super(SubCategory , self).save(*args , **kwargs))
 	
 	def __str__(self):
 		return f"{self.category.name} → {self.name}"
@@ -47,16 +86,19 @@ class SubCategory(models.Model):
 		db_table = 'sub_category'
 
 
-class Brand(models.Model):
+class Brand(RenderedRichTextModel):
+	richtext_fields = ("description" ,)
+	
 	name = models.CharField(max_length=150 , unique=True)
 	description = RichTextField(blank=True , null=True)
-	logo = models.ImageField(upload_to="brands/" , blank=True , null=True)
+	logo = models.ImageField(upload_to="brands/" , storage=image_storage , blank=True , null=True)
+	logo_variants = models.JSONField(default=dict , blank=True , editable=False)  # see core.images
 	slug = models.SlugField(unique=True , blank=True)
 	
 	def save(self , *args , **kwargs):
-		if not self.slug:
-			self.slug = slugify(self.name)
-		super().save(*args , **kwargs)
+		if self.slug:
+			return super().save(*args , **kwargs)
+		save_with_unique_slug(self , slugify(self.name) , lambda: super(Brand , self).save(*args , **kwargs))
 	
 	def __str__(self):
 		return self.name
@@ -65,7 +107,9 @@ class Brand(models.Model):
 		db_table = 'brand'
 
 
-class Manufacturer(models.Model):
+class Manufacturer(RenderedRichTextModel):
+	richtext_fields = ("address" ,)
+	
 	name = models.CharField(max_length=200)
 	address = RichTextField(blank=True , null=True)
 	contact_email = models.EmailField(blank=True , null=True)
@@ -77,7 +121,9 @@ class Manufacturer(models.Model):
 		db_table = 'manufacturer'
 
 
-class SaltComposition(models.Model):
+class SaltComposition(RenderedRichTextModel):
+	richtext_fields = ("description" ,)
+	
 	name = models.CharField(max_length=200)
 	strength = models.CharField(max_length=100 , blank=True , null=True)  # e.g. "500mg"
 	description = RichTextField(blank=True , null=True)
@@ -89,12 +135,106 @@ class SaltComposition(models.Model):
 		db_table = 'salt_composition'
 
 
-class Product(models.Model):
+PRICE_FIELDS = {"base_price" , "selling_price"}
+
+DISCOUNT_PERCENTAGE = Case(
+	When(
+		base_price__gt=0 ,
+		then=ExpressionWrapper(
+			(F('base_price') - F('selling_price')) * 100.0 / F('base_price') ,
+			output_field=FloatField()
+		)
+	) ,
+	default=None ,
+	output_field=FloatField()
+)
+
+
+def salt_signature(salts):
+	"""
+	Canonical key for a set of (salt name, strength) pairs: products with the
+	same key are generic substitutes. Empty when there are no salts.
+	"""
+	canonical = sorted({
+		(" ".join((name or "").lower().split()) , "".join((strength or "").lower().split()))
+		for name , strength in salts
+	})
+	if not canonical:
+		return ""
+	return hashlib.sha1(repr(canonical).encode()).hexdigest()
+
+
+class ProductQuerySet(models.QuerySet):
+	# Keep the stored discount_percentage in sync with bulk price changes
+	
+	def update(self , **kwargs):
+		if not PRICE_FIELDS.intersection(kwargs):
+			rows = super().update(**kwargs)
+		else:
+			with transaction.atomic(using=self.db):
+				pks = list(self.values_list("pk" , flat=True))
+				rows = super().update(**kwargs)
+				self.model._base_manager.using(self.db).filter(pk__in=pks).update(
+					discount_percentage=DISCOUNT_PERCENTAGE
+				)
+		if rows:
+			# No signals for bulk writes, so expire cached catalog responses
+			# here (core.caching imports this module)
+			from .caching import bump_catalog_generation
+			transaction.on_commit(bump_catalog_generation , using=self.db)
+		return rows
+	
+	def bulk_create(self , objs , *args , **kwargs):
+		objs = list(objs)
+		for obj in objs:
+			obj.discount_percentage = obj.calculate_discount_percentage()
+			obj.render_richtext()
+		return super().bulk_create(objs , *args , **kwargs)
+	
+	def bulk_update(self , objs , fields , *args , **kwargs):
+		fields = list(fields)
+		objs = list(objs)
+		if PRICE_FIELDS.intersection(fields):
+			for obj in objs:
+				obj.discount_percentage = obj.calculate_discount_percentage()
+			if "discount_percentage" not in fields:
+				fields.append("discount_percentage")
+		if set(self.model.richtext_fields).intersection(fields):
+			for obj in objs:
+				obj.render_richtext()
+			fields += [field for field in self.model.RENDERED_FIELDS if field not in fields]
+		return super().bulk_update(objs , fields , *args , **kwargs)
+	
+	def refresh_salt_signatures(self):
+		"""
+		Recompute salt_signature for these products from one read of the M2M
+		table, writing one UPDATE per distinct signature.
+		"""
+		product_ids = list(self.values_list("pk" , flat=True))
+		salts = defaultdict(list)
+		rows = Product.salt_compositions.through.objects.filter(product_id__in=product_ids).values_list(
+			"product_id" , "saltcomposition__name" , "saltcomposition__strength"
+		)
+		for product_id , name , strength in rows:
+			salts[product_id].append((name , strength))
+		
+		by_signature = defaultdict(list)
+		for product_id in product_ids:
+			by_signature[salt_signature(salts[product_id])].append(product_id)
+		for signature , ids in by_signature.items():
+			self.model._base_manager.using(self.db).filter(pk__in=ids).update(salt_signature=signature)
+
+
+class Product(RenderedRichTextModel):
+	richtext_fields = ("description" , "uses" , "benefits" , "side_effects" , "dosage" , "storage")
+	
 	# Relations
 	subcategory = models.ForeignKey(SubCategory , on_delete=models.SET_NULL , null=True , related_name="products")
 	brand = models.ForeignKey(Brand , on_delete=models.SET_NULL , null=True , related_name="products")
 	manufacturer = models.ForeignKey(Manufacturer , on_delete=models.SET_NULL , null=True , related_name="products")
 	salt_compositions = models.ManyToManyField(SaltComposition , blank=True , related_name="products")
+	# Generic-substitute key, kept in sync with salt_compositions by core.signals
+	salt_signature = models.CharField(max_length=40 , blank=True , default="" , editable=False)
 	
 	# Basic info
 	name = models.CharField(max_length=255)
@@ -103,6 +243,7 @@ class Product(models.Model):
 	# Pricing
 	base_price = models.DecimalField(max_digits=10 , decimal_places=2 , blank=True , null=True)
 	selling_price = models.DecimalField(max_digits=10 , decimal_places=2 , blank=True , null=True)
+	discount_percentage = models.FloatField(blank=True , null=True , editable=False)  # derived from the prices on save
 	
 	# Medicine details
 	description = RichTextField(blank=True , null=True)
@@ -124,29 +265,52 @@ class Product(models.Model):
 	stock = models.PositiveIntegerField(default=0)
 	available = models.BooleanField(default=True)
 	created_at = models.DateField(auto_now_add=True , blank=True , null=True)
-	updated_at = models.DateField(auto_now=True , blank=True , null=True)
+	updated_at = models.DateTimeField(auto_now=True , blank=True , null=True)
+	
+	objects = ProductQuerySet.as_manager()
+	
+	@classmethod
+	def from_db(cls , db , field_names , values):
+		instance = super().from_db(db , field_names , values)
+		# Remembered so signal handlers can tell when a product changes subcategory
+		instance._loaded_subcategory_id = instance.__dict__.get("subcategory_id")
+		return instance
+	
+	def calculate_discount_percentage(self):
+		if not self.base_price or self.selling_price is None:
+			return None
+		return float((self.base_price - self.selling_price) * 100 / self.base_price)
 	
 	def save(self , *args , **kwargs):
-		if not self.slug:
-			base_slug = slugify(self.name)
-			slug = base_slug
-			counter = 1
-			while Product.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-				slug = f"{base_slug}-{counter}"
-				counter += 1
-			self.slug = slug
-		super().save(*args , **kwargs)
+		self.discount_percentage = self.calculate_discount_percentage()
+		update_fields = kwargs.get("update_fields")
+		if update_fields is not None and PRICE_FIELDS.intersection(update_fields):
+			kwargs["update_fields"] = {*update_fields , "discount_percentage"}
+		
+		if self.slug:
+			return super().save(*args , **kwargs)
+		save_with_unique_slug(self , slugify(self.name) , lambda: super(Product , self).save(*args , **kwargs))
 	
 	def __str__(self):
 		return self.name
 	
 	class Meta:
 		db_table = 'product'
+		indexes = [
+			models.Index(fields=["available" , "discount_percentage"] , name="product_avail_discount_idx") ,
+			models.Index(fields=["salt_signature" , "selling_price"] , name="product_salt_sig_price_idx") ,
+		]
 
 
 class ProductImage(models.Model):
 	product = models.ForeignKey(Product , on_delete=models.CASCADE , related_name="images")
-	image = models.ImageField(upload_to="products/" , blank=True , null=True)
+	image = models.ImageField(upload_to="products/" , storage=image_storage , blank=True , null=True)
+	variants = models.JSONField(default=dict , blank=True , editable=False)  # see core.images
+	# Placeholder data for clients, filled with the variants
+	width = models.PositiveIntegerField(blank=True , null=True , editable=False)
+	height = models.PositiveIntegerField(blank=True , null=True , editable=False)
+	dominant_color = models.CharField(max_length=7 , blank=True , default="" , editable=False)
+	lqip = models.TextField(blank=True , default="" , editable=False)
 	
 	def __str__(self):
 		return f"Image for {self.product.name}"
@@ -173,17 +337,231 @@ class Address(models.Model):
 		db_table = 'address'
 
 
+class InsufficientStock(Exception):
+	def __init__(self , message , available=None):
+		super().__init__(message)
+		self.available = available
+
+
+def fold_cart_operations(current , operations):
+	"""
+	Final {product_id: quantity} after applying (op, product_id, quantity)
+	operations to `current`; removed lines are left at 0.
+	"""
+	final = dict(current)
+	for op , product_id , quantity in operations:
+		if op == "remove":
+			final[product_id] = 0
+		elif op == "set":
+			final[product_id] = quantity
+		else:
+			final[product_id] = final.get(product_id , 0) + quantity
+	return final
+
+
+class CartQuerySet(models.QuerySet):
+
+	def add(self , user , product_id , quantity):
+		"""
+		Add `quantity` of a product to the user's cart as one atomic statement
+		that also checks stock: an F() increment of the existing line, or an
+		INSERT ... SELECT from the product row for a new one. The unique
+		(user, product) constraint turns a racing insert into a retried
+		increment. Returns (item, created) or raises InsufficientStock.
+		"""
+		for attempt in range(2):
+			if self.increment(user , product_id , quantity):
+				return self.get(user=user , product_id=product_id) , False
+			try:
+				with transaction.atomic(using=self.db):
+					inserted = self.insert(user , product_id , quantity)
+			except IntegrityError:
+				# The line exists: either its stock check failed above or a
+				# concurrent add just created it, so try the increment again
+				continue
+			if inserted:
+				return self.get(user=user , product_id=product_id) , True
+			break
+		raise self.stock_error(user , product_id)
+	
+	def increment(self , user , product_id , quantity):
+		stock = Subquery(
+			Product.objects.filter(pk=OuterRef("product_id") , available=True).values("stock")[:1]
+		)
+		# Compared as quantity + n <= stock: on MySQL's unsigned columns
+		# stock - n would overflow (error 1690) whenever n exceeds stock
+		return (
+			self.alias(new_quantity=F("quantity") + quantity)
+			.filter(user=user , product_id=product_id , new_quantity__lte=stock)
+			.update(quantity=F("quantity") + quantity)
+		)
+	
+	def insert(self , user , product_id , quantity):
+		connection = connections[self.db]
+		quote = connection.ops.quote_name
+		field = self.model._meta.get_field
+		product_field = Product._meta.get_field
+		sql = (
+			f"INSERT INTO {quote(self.model._meta.db_table)} "
+			f"({quote(field('user').column)} , {quote(field('product').column)} , "
+			f"{quote(field('quantity').column)} , {quote(field('added_at').column)}) "
+			f"SELECT %s , {quote(product_field('id').column)} , %s , %s "
+			f"FROM {quote(Product._meta.db_table)} "
+			f"WHERE {quote(product_field('id').column)} = %s "
+			f"AND {quote(product_field('available').column)} = %s "
+			f"AND {quote(product_field('stock').column)} >= %s"
+		)
+		params = [
+			user.pk , quantity ,
+			connection.ops.adapt_datetimefield_value(timezone.now()) ,
+			product_id , True , quantity ,
+		]
+		with connection.cursor() as cursor:
+			cursor.execute(sql , params)
+			return cursor.rowcount
+	
+	def apply(self , user , operations):
+		"""
+		Apply (op, product_id, quantity) operations, op being "set",
+		"increment" or "remove", to the user's cart in one transaction: the
+		touched lines are locked, their final quantities worked out here and
+		written with one bulk upsert and one bulk delete. Nothing is written
+		if a line would exceed stock; returns the failures, one dict per
+		product.
+		"""
+		product_ids = list(dict.fromkeys(product_id for op , product_id , quantity in operations))
+		with transaction.atomic(using=self.db):
+			current = dict(
+				self.select_for_update()
+				.filter(user=user , product_id__in=product_ids)
+				.values_list("product_id" , "quantity")
+			)
+			final = fold_cart_operations(current , operations)
+			errors = self.batch_errors(final , current)
+			if errors:
+				return errors
+			
+			upserts = [
+				self.model(user=user , product_id=product_id , quantity=quantity)
+				for product_id , quantity in final.items()
+				if quantity and quantity != current.get(product_id)
+			]
+			if upserts:
+				self.upsert(upserts)
+			removed = [product_id for product_id , quantity in final.items() if not quantity and product_id in current]
+			if removed:
+				self.filter(user=user , product_id__in=removed).delete()
+		return []
+	
+	def merge(self , user , lines):
+		"""
+		Add a guest cart's {product_id: quantity} lines to the user's cart
+		with one bulk upsert, capped by stock; unavailable and deleted
+		products are dropped. Returns the number of lines written.
+		"""
+		product_ids = list(lines)
+		with transaction.atomic(using=self.db):
+			current = dict(
+				self.select_for_update()
+				.filter(user=user , product_id__in=product_ids)
+				.values_list("product_id" , "quantity")
+			)
+			products = Product.objects.filter(available=True).only("stock").in_bulk(product_ids)
+			upserts = []
+			for product_id , quantity in lines.items():
+				if product_id not in products:
+					continue
+				merged = min(current.get(product_id , 0) + quantity , products[product_id].stock)
+				if merged > current.get(product_id , 0):
+					upserts.append(self.model(user=user , product_id=product_id , quantity=merged))
+			if upserts:
+				self.upsert(upserts)
+		return len(upserts)
+	
+	def upsert(self , lines):
+		"""
+		Insert Cart rows, or overwrite the quantity of the (user, product)
+		lines that already exist.
+		"""
+		# MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+		features = connections[self.db].features
+		unique_fields = ["user" , "product"] if features.supports_update_conflicts_with_target else None
+		return self.bulk_create(
+			lines , update_conflicts=True ,
+			unique_fields=unique_fields , update_fields=["quantity"]
+		)
+	
+	def batch_errors(self , final , current):
+		# Lowering or removing a line is always allowed, even past a stock drop
+		raised = [product_id for product_id , quantity in final.items() if quantity > current.get(product_id , 0)]
+		products = Product.objects.only("stock" , "available").in_bulk(raised)
+		errors = []
+		for product_id in raised:
+			product = products.get(product_id)
+			if product is None:
+				errors.append({"product": product_id , "error": "Product not found."})
+			elif not product.available:
+				errors.append({"product": product_id , "error": "Product is not available." , "available": 0})
+			elif final[product_id] > product.stock:
+				errors.append({
+					"product": product_id ,
+					"error": f"Only {product.stock} in stock." ,
+					"available": product.stock ,
+				})
+		return errors
+	
+	def with_totals(self):
+		"""
+		Annotate each line with line_total and line_savings (against
+		base_price), and every row with the whole cart's cart_count,
+		cart_subtotal and cart_savings as window aggregates, so the lines and
+		the totals come back in one query.
+		"""
+		money = DecimalField(max_digits=12 , decimal_places=2)
+		selling_price , base_price = F("product__selling_price") , F("product__base_price")
+		return self.annotate(
+			line_total=ExpressionWrapper(selling_price * F("quantity") , output_field=money) ,
+			line_savings=Case(
+				When(
+					product__base_price__gt=selling_price ,
+					then=ExpressionWrapper((base_price - selling_price) * F("quantity") , output_field=money)
+				) ,
+				default=Value(0 , output_field=money) ,
+				output_field=money ,
+			) ,
+		).annotate(
+			cart_count=Window(Count("pk")) ,
+			cart_subtotal=Coalesce(Window(Sum("line_total")) , Value(0 , output_field=money)) ,
+			cart_savings=Window(Sum("line_savings")) ,
+		)
+	
+	def stock_error(self , user , product_id):
+		product = Product.objects.filter(pk=product_id).values("stock" , "available").first()
+		if product is None:
+			return InsufficientStock("Product not found.")
+		if not product["available"]:
+			return InsufficientStock("Product is not available." , available=0)
+		in_cart = self.filter(user=user , product_id=product_id).values_list("quantity" , flat=True).first() or 0
+		available = max(product["stock"] - in_cart , 0)
+		return InsufficientStock(f"Only {available} more can be added." , available=available)
+
+
 class Cart(models.Model):
 	user = models.ForeignKey(settings.AUTH_USER_MODEL , on_delete=models.CASCADE , related_name="cart")
 	product = models.ForeignKey(Product , on_delete=models.CASCADE)
 	quantity = models.PositiveIntegerField(default=1)
 	added_at = models.DateTimeField(auto_now_add=True)
 	
+	objects = CartQuerySet.as_manager()
+	
 	def __str__(self):
 		return f"{self.user.username} → {self.product.name} x {self.quantity}"
 	
 	class Meta:
 		db_table = 'cart'
+		constraints = [
+			models.UniqueConstraint(fields=["user" , "product"] , name="cart_user_product_unique") ,
+		]
 
 
 class Wishlist(models.Model):
@@ -0,0 +1,216 @@
+import json
+import operator
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F , Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor , CursorPagination , PageNumberPagination
+from rest_framework.utils.urls import remove_query_param
+
+
+def is_nullable(model , name):
+	try:
+		return model._meta.get_field(name).null
+	except FieldDoesNotExist:
+		return False  # pk, annotations
+
+
+class KeysetPagination(CursorPagination):
+	"""
+	Cursor (keyset) pagination: each page is a `WHERE key > last_seen`
+	lookup with no OFFSET scan and no COUNT(*).
+
+	The cursor holds the whole sort key of the last row seen, primary key
+	included, so rows sharing a value never need an offset. NULLs sort
+	after every value (before them when paging backwards) and are kept as
+	null in the cursor, so the position filter can cross into the NULL rows.
+
+	Clients that still send `?page=N` get the old PageNumberPagination
+	response, so existing page links keep working.
+	"""
+	legacy_pagination_class = PageNumberPagination
+
+	def paginate_queryset(self , queryset , request , view=None):
+		self.legacy_paginator = None
+		ordering = self.get_ordering(request , queryset , view)
+		if self.legacy_pagination_class.page_query_param in request.query_params:
+			self.legacy_paginator = self.legacy_pagination_class()
+			queryset = queryset.order_by(*self.order_by(queryset.model , ordering , reverse=False))
+			return self.legacy_paginator.paginate_queryset(queryset , request , view)
+		return self.paginate_keyset(queryset , request , ordering)
+
+	def paginate_keyset(self , queryset , request , ordering):
+		# CursorPagination.paginate_queryset, filtering on the whole sort key
+		self.request = request
+		self.page_size = self.get_page_size(request)
+		if not self.page_size:
+			return None
+
+		self.base_url = request.build_absolute_uri()
+		self.ordering = ordering
+		self.cursor = self.decode_cursor(request)
+		offset , reverse , current_position = self.cursor or (0 , False , None)
+
+		queryset = queryset.order_by(*self.order_by(queryset.model , ordering , reverse))
+		if current_position is not None:
+			queryset = queryset.filter(self.position_filter(queryset.model , ordering , current_position , reverse))
+
+		# One extra row tells whether another page follows
+		results = list(queryset[offset:offset + self.page_size + 1])
+		self.page = results[:self.page_size]
+		has_following_position = len(results) > len(self.page)
+		following_position = self._get_position_from_instance(results[-1] , ordering) if has_following_position else None
+
+		if reverse:
+			self.page.reverse()
+			self.has_next = current_position is not None or offset > 0
+			self.has_previous = has_following_position
+			self.next_position = current_position
+			self.previous_position = following_position
+		else:
+			self.has_next = has_following_position
+			self.has_previous = current_position is not None or offset > 0
+			self.next_position = following_position
+			self.previous_position = current_position
+
+		if (self.has_previous or self.has_next) and self.template is not None:
+			self.display_page_controls = True
+		return self.page
+
+	def get_ordering(self , request , queryset , view):
+		ordering = super().get_ordering(request , queryset , view)
+		# End on the primary key so every row has a distinct position
+		if ordering[-1].lstrip("-") not in ("pk" , "id"):
+			ordering += ("-pk" if ordering[0].startswith("-") else "pk" ,)
+		return ordering
+
+	def order_by(self , model , ordering , reverse):
+		"""
+		`ordering` as order_by() arguments, flipped when paging backwards.
+		Nullable columns sort as (column IS NULL, column).
+		"""
+		expressions = []
+		for name in ordering:
+			field = name.lstrip("-")
+			descending = name.startswith("-") != reverse
+			if is_nullable(model , field):
+				nulls = {"nulls_first": True} if reverse else {"nulls_last": True}
+				expressions.append(F(field).desc(**nulls) if descending else F(field).asc(**nulls))
+			else:
+				expressions.append(f"-{field}" if descending else field)
+		return expressions
+
+	def position_filter(self , model , ordering , position , reverse):
+		"""
+		Rows after `position` in the (possibly backwards) ordering: for some
+		key column, equal on all columns before it and past it on that one.
+		"""
+		try:
+			values = json.loads(position)
+		except ValueError:
+			raise NotFound(self.invalid_cursor_message)
+		if not isinstance(values , list) or len(values) != len(ordering):
+			raise NotFound(self.invalid_cursor_message)
+
+		conditions = []
+		equal = Q()
+		for name , value in zip(ordering , values):
+			field = name.lstrip("-")
+			descending = name.startswith("-") != reverse
+			# NULLs come last going forwards, so first going backwards
+			nulls_after = is_nullable(model , field) and not reverse
+			if value is None:
+				after = None if nulls_after else Q(**{f"{field}__isnull": False})
+				same = Q(**{f"{field}__isnull": True})
+			else:
+				after = Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+				if nulls_after:
+					after |= Q(**{f"{field}__isnull": True})
+				same = Q(**{field: value})
+			if after is not None:
+				conditions.append(equal & after)
+			equal &= same
+		if not conditions:
+			return Q(pk__in=[])
+		return reduce(operator.or_ , conditions)
+
+	def _get_position_from_instance(self , instance , ordering):
+		values = []
+		for name in ordering:
+			value = instance[name.lstrip("-")] if isinstance(instance , dict) else getattr(instance , name.lstrip("-"))
+			values.append(None if value is None else str(value))
+		return json.dumps(values , separators=("," , ":"))
+
+	def get_paginated_response(self , data):
+		if self.legacy_paginator is not None:
+			return self.legacy_paginator.get_paginated_response(data)
+		return super().get_paginated_response(data)
+
+	def to_html(self):
+		if self.legacy_paginator is not None:
+			return self.legacy_paginator.to_html()
+		return super().to_html()
+
+
+class ProductPagination(KeysetPagination):
+	ordering = "name"
+
+	def paginate_queryset(self , queryset , request , view=None):
+		# Search results keep their relevance order unless ?ordering= is given
+		self.ranked_links = None
+		ranking = getattr(view , "search_ranking" , None)
+		if ranking is None or request.query_params.get("ordering"):
+			return super().paginate_queryset(queryset , request , view)
+		return self.paginate_ranked(queryset , request , view , ranking)
+
+	def paginate_ranked(self , queryset , request , view , ranking):
+		"""
+		Page through search hits by relevance: the ids that survive the other
+		filters are read in one query, ordered and sliced here, and only the
+		page's rows are loaded. The cursor is an offset into that order.
+		"""
+		ids = queryset.order_by().prefetch_related(None).values_list("pk" , flat=True)
+		ids = sorted(ids , key=lambda pk: (-ranking[pk] , pk))
+
+		self.legacy_paginator = None
+		if self.legacy_pagination_class.page_query_param in request.query_params:
+			self.legacy_paginator = self.legacy_pagination_class()
+			page_ids = self.legacy_paginator.paginate_queryset(ids , request , view)
+		else:
+			self.base_url = request.build_absolute_uri()
+			self.page_size = self.get_page_size(request)
+			self.offset_cutoff = None  # offsets index the ranked ids, not duplicate keys
+			cursor = self.decode_cursor(request)
+			offset = cursor.offset if cursor else 0
+			page_ids = ids[offset:offset + self.page_size]
+
+			links = {"next": None , "previous": None}
+			if offset + self.page_size < len(ids):
+				links["next"] = self.encode_cursor(Cursor(offset=offset + self.page_size , reverse=False , position=None))
+			if offset > self.page_size:
+				links["previous"] = self.encode_cursor(Cursor(offset=offset - self.page_size , reverse=False , position=None))
+			elif offset > 0:
+				links["previous"] = remove_query_param(self.base_url , self.cursor_query_param)
+			self.ranked_links = links
+
+		rows = queryset.order_by().in_bulk(list(page_ids))
+		return [rows[pk] for pk in page_ids if pk in rows]
+
+	def get_next_link(self):
+		if self.ranked_links is not None:
+			return self.ranked_links["next"]
+		return super().get_next_link()
+
+	def get_previous_link(self):
+		if self.ranked_links is not None:
+			return self.ranked_links["previous"]
+		return super().get_previous_link()
+
+
+class OrderPagination(KeysetPagination):
+	ordering = "-created_at"
+
+
+class OrderItemPagination(KeysetPagination):
+	ordering = "-id"
@@ -0,0 +1,107 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+# Relations read by a model's __str__, i.e. by StringRelatedField
+STR_RELATIONS = {
+	"core.subcategory": ("category" ,) ,
+}
+
+
+def resolve_relation(model , source):
+	"""
+	Follow a serializer field source through model relations.
+	Returns (path, related_model, many) or None when it is not a relation.
+	"""
+	path , many = [] , False
+	for attr in source.split("."):
+		try:
+			field = model._meta.get_field(attr)
+		except FieldDoesNotExist:
+			break
+		if not field.is_relation or field.related_model is None:
+			break
+		path.append(attr)
+		many = many or field.many_to_many or field.one_to_many
+		model = field.related_model
+
+	if not path:
+		return None
+	return "__".join(path) , model , many
+
+
+def plan_relations(serializer , model):
+	"""
+	Work out what rendering `serializer` over `model` instances touches.
+	Returns (select_related paths, [(prefetch path, queryset or None)]).
+	"""
+	meta = getattr(serializer , "Meta" , None)
+	select = list(getattr(meta , "select_related" , ()))
+	prefetch = [(path , None) for path in getattr(meta , "prefetch_related" , ())]
+
+	for field in serializer.fields.values():
+		if field.write_only or field.source == "*":
+			continue
+		relation = resolve_relation(model , field.source)
+		if relation is None:
+			continue
+		path , related_model , many = relation
+
+		child = field
+		if isinstance(field , serializers.ListSerializer):
+			child = field.child
+		elif isinstance(field , serializers.ManyRelatedField):
+			child = field.child_relation
+
+		if isinstance(child , serializers.BaseSerializer):
+			nested_select , nested_prefetch = plan_relations(child , related_model)
+		elif isinstance(child , serializers.PrimaryKeyRelatedField) and not many:
+			continue  # reads the FK column only
+		else:
+			nested_select = list(STR_RELATIONS.get(related_model._meta.label_lower , ()))
+			nested_prefetch = []
+
+		if many:
+			queryset = related_model._default_manager.all()
+			if nested_select:
+				queryset = queryset.select_related(*nested_select)
+			if nested_prefetch:
+				queryset = queryset.prefetch_related(*build_prefetches(nested_prefetch))
+			prefetch.append((path , queryset))
+		else:
+			select.append(path)
+			select += [f"{path}__{nested}" for nested in nested_select]
+			prefetch += [(f"{path}__{nested}" , queryset) for nested , queryset in nested_prefetch]
+
+	return select , prefetch
+
+
+def build_prefetches(prefetch):
+	return [
+		Prefetch(path , queryset=queryset) if queryset is not None else path
+		for path , queryset in prefetch
+	]
+
+
+def plan_queryset(queryset , serializer):
+	"""
+	Add the select_related/prefetch_related calls `serializer` needs, so a
+	page costs the same number of queries whatever its size.
+	"""
+	select , prefetch = plan_relations(serializer , queryset.model)
+	if select:
+		queryset = queryset.select_related(*dict.fromkeys(select))
+	if prefetch:
+		queryset = queryset.prefetch_related(*build_prefetches(prefetch))
+	return queryset
+
+
+class QueryPlanMixin:
+	"""
+	Plan the viewset queryset from its serializer after filtering.
+	"""
+
+	def filter_queryset(self , queryset):
+		queryset = super().filter_queryset(queryset)
+		serializer = self.get_serializer_class()(context=self.get_serializer_context())
+		return plan_queryset(queryset , serializer)
@@ -0,0 +1,181 @@
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.utils.text import Truncator
+
+ALLOWED_TAGS = {
+	"p" , "br" , "hr" , "div" , "pre" , "code" , "strong" , "b" , "em" , "i" , "u" , "s" ,
+	"sub" , "sup" , "span" , "ul" , "ol" , "li" , "dl" , "dt" , "dd" ,
+	"h1" , "h2" , "h3" , "h4" , "h5" , "h6" , "blockquote" , "figure" , "figcaption" ,
+	"table" , "caption" , "thead" , "tbody" , "tfoot" , "tr" , "th" , "td" , "a" , "img" ,
+}
+ALLOWED_ATTRIBUTES = {
+	"a": {"href" , "title"} ,
+	"img": {"src" , "alt" , "width" , "height"} ,
+	"th": {"colspan" , "rowspan"} ,
+	"td": {"colspan" , "rowspan"} ,
+}
+# Allowed on any tag, filtered by ALLOWED_STYLES
+GLOBAL_ATTRIBUTES = {"style"}
+URL_ATTRIBUTES = {"href" , "src"}
+NUMERIC_ATTRIBUTES = {"width" , "height" , "colspan" , "rowspan"}
+ALLOWED_URL_SCHEMES = {"" , "http" , "https" , "mailto" , "tel"}
+VOID_TAGS = {"br" , "hr" , "img"}
+
+# CKEditor's alignment, colour and sizing styles; values are limited to plain
+# keywords, numbers, colours and lengths (no url(), no expression())
+ALLOWED_STYLES = {
+	"text-align" , "color" , "background-color" , "font-weight" , "font-style" ,
+	"text-decoration" , "width" , "height" , "float" , "margin" , "margin-left" , "margin-right" ,
+}
+STYLE_VALUE_RE = re.compile(r"^(?:[#a-z0-9 .,%-]+|rgba?\([0-9 ,.%]+\))$" , re.IGNORECASE)
+NUMERIC_RE = re.compile(r"^[0-9]{1,5}%?$")
+
+# Dropped together with everything inside them
+DROP_CONTENT_TAGS = {"script" , "style" , "iframe" , "object" , "embed" , "template"}
+
+# Tags that end a line of text in the plain-text version; when one of them is
+# not allowed, a space keeps the text on either side apart in the HTML
+BLOCK_TAGS = {
+	"p" , "br" , "hr" , "li" , "h1" , "h2" , "h3" , "h4" , "h5" , "h6" , "dt" , "dd" ,
+	"blockquote" , "tr" , "div" , "pre" , "table" , "caption" , "figure" , "figcaption" ,
+	"section" , "article" , "header" , "footer" , "aside" , "nav" , "address" , "main" ,
+}
+
+# An open one of these is closed by the next sibling of the same tag (`<li>a<li>b`)
+IMPLIED_END_TAGS = {"p" , "li" , "tr" , "td" , "th"}
+
+EXCERPT_LENGTH = 200
+
+
+class RichTextRenderer(HTMLParser):
+	"""
+	Allowlist sanitizer that builds the safe HTML and the plain text of a
+	RichText value in one pass.
+	"""
+
+	def __init__(self):
+		super().__init__(convert_charrefs=True)
+		self.html = []
+		self.text = []
+		self.open_tags = []
+		self.skip_depth = 0
+
+	def handle_starttag(self , tag , attrs):
+		if tag in DROP_CONTENT_TAGS:
+			self.skip_depth += 1
+			return
+		if self.skip_depth:
+			return
+		if tag in BLOCK_TAGS:
+			self.text.append("\n")
+		if tag not in ALLOWED_TAGS:
+			if tag in BLOCK_TAGS:
+				self.html.append(" ")
+			return
+		if tag in IMPLIED_END_TAGS and self.open_tags and self.open_tags[-1] == tag:
+			self.handle_endtag(tag)
+
+		rendered = ""
+		for name , value in attrs:
+			value = self.clean_attribute(tag , name , value)
+			if value:
+				rendered += f' {name}="{escape(value , quote=True)}"'
+		if tag == "img" and " src=" not in rendered:
+			return
+		if tag == "a":
+			rendered += ' rel="nofollow noopener"'
+
+		self.html.append(f"<{tag}{rendered}>")
+		if tag not in VOID_TAGS:
+			self.open_tags.append(tag)
+
+	def clean_attribute(self , tag , name , value):
+		"""
+		The attribute value to keep, or None to drop the attribute.
+		"""
+		if value is None or name not in ALLOWED_ATTRIBUTES.get(tag , set()) | GLOBAL_ATTRIBUTES:
+			return None
+		value = value.strip()
+		if name in URL_ATTRIBUTES:
+			return value if urlsplit(value).scheme.lower() in ALLOWED_URL_SCHEMES else None
+		if name in NUMERIC_ATTRIBUTES:
+			return value if NUMERIC_RE.match(value) else None
+		if name == "style":
+			declarations = []
+			for declaration in value.split(";"):
+				prop , _ , prop_value = declaration.partition(":")
+				prop , prop_value = prop.strip().lower() , prop_value.strip()
+				if prop in ALLOWED_STYLES and STYLE_VALUE_RE.match(prop_value):
+					declarations.append(f"{prop}: {prop_value}")
+			return "; ".join(declarations) or None
+		return value
+
+	def handle_startendtag(self , tag , attrs):
+		self.handle_starttag(tag , attrs)
+		if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+			self.handle_endtag(tag)
+
+	def handle_endtag(self , tag):
+		if tag in DROP_CONTENT_TAGS:
+			self.skip_depth = max(self.skip_depth - 1 , 0)
+			return
+		if self.skip_depth:
+			return
+		if tag in BLOCK_TAGS:
+			self.text.append("\n")
+			if tag not in ALLOWED_TAGS:
+				self.html.append(" ")
+		if tag not in self.open_tags:
+			return
+		# Close anything left open inside this tag so the output stays balanced
+		while self.open_tags:
+			open_tag = self.open_tags.pop()
+			self.html.append(f"</{open_tag}>")
+			if open_tag == tag:
+				break
+
+	def handle_data(self , data):
+		if self.skip_depth:
+			return
+		self.html.append(escape(data , quote=False))
+		self.text.append(data)
+
+	def render(self , value):
+		self.feed(value)
+		self.close()
+		while self.open_tags:
+			self.html.append(f"</{self.open_tags.pop()}>")
+
+		lines = (" ".join(line.split()) for line in "".join(self.text).split("\n"))
+		return "".join(self.html) , "\n".join(line for line in lines if line)
+
+
+def render_richtext(value):
+	"""
+	Return (sanitized html, plain text) for a RichText value.
+	"""
+	if not value:
+		return value , ""
+	return RichTextRenderer().render(value)
+
+
+def make_excerpt(text , length=EXCERPT_LENGTH):
+	return Truncator(" ".join(text.split())).chars(length)
+
+
+def render_fields(values):
+	"""
+	Render an ordered {field: RichText value} mapping into the
+	(rendered_html, plain_text, excerpt) stored by RenderedRichTextModel.
+	The first field with text supplies the excerpt.
+	"""
+	rendered_html , texts = {} , []
+	for field , value in values.items():
+		html , text = render_richtext(value)
+		rendered_html[field] = html
+		if text:
+			texts.append(text)
+	return rendered_html , "\n\n".join(texts) , make_excerpt(texts[0]) if texts else ""
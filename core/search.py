@@ -0,0 +1,604 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left , insort
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.utils.html import strip_tags
+from rest_framework import filters
+
+from .caching import shared_counter , bump_shared_counter
+from .models import Brand , SaltComposition , Product
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Ranking weights per indexed field: a hit in the name beats a hit in
+# uses, which beats a hit in the description.
+FIELD_WEIGHTS = {
+	"name": 10.0 ,
+	"brand": 6.0 ,
+	"salts": 6.0 ,
+	"uses": 4.0 ,
+	"benefits": 2.0 ,
+	"description": 1.0 ,
+}
+
+# Query terms also match longer tokens ("abira" -> "abiraterone"), but an
+# exact token hit always ranks above a prefix hit of the same field.
+PREFIX_MATCH_FACTOR = 0.5
+
+# Minimum trigram similarity for a fuzzy token match (same default as pg_trgm).
+TRIGRAM_THRESHOLD = 0.3
+
+# Names covered by the fuzzy matcher and autocomplete: type -> (model, fields to load)
+NAME_SOURCES = {
+	"product": (Product , ("id" , "name" , "slug")) ,
+	"brand": (Brand , ("id" , "name" , "slug")) ,
+	"salt": (SaltComposition , ("id" , "name")) ,
+}
+
+
+def tokenize(text):
+	if not text:
+		return []
+	return TOKEN_RE.findall(strip_tags(text).lower())
+
+
+# Product columns read by the indexes (product_documents() and NAME_SOURCES);
+# saves touching none of them leave the indexes as they are
+PRODUCT_INDEXED_FIELDS = frozenset(("name" , "slug" , "description" , "uses" , "benefits" , "brand" , "brand_id"))
+
+
+def product_documents(product_ids=None):
+	"""
+	Yield (product_id, {field: text}) for the products to index.
+	"""
+	products = (
+		Product.objects
+		.select_related("brand")
+		.prefetch_related("salt_compositions")
+		.only("id" , "name" , "description" , "uses" , "benefits" , "brand__name")
+		.order_by("pk")
+	)
+	if product_ids is not None:
+		products = products.filter(pk__in=product_ids)
+
+	for product in products.iterator(chunk_size=500):
+		yield product.pk , {
+			"name": product.name ,
+			"brand": product.brand.name if product.brand else "" ,
+			"salts": " ".join(salt.name for salt in product.salt_compositions.all()) ,
+			"uses": product.uses ,
+			"benefits": product.benefits ,
+			"description": product.description ,
+		}
+
+
+# Bumped in the shared cache whenever indexed rows change (see SharedIndex)
+SEARCH_VERSION_KEY = "search:version"
+
+# Each bump also logs the rows it changed, so other workers can catch up
+# by re-reading just those rows. A worker further behind than
+# SEARCH_LOG_LENGTH versions, or missing an entry, rebuilds instead; so does
+# every worker after a change too large to log.
+SEARCH_LOG_LENGTH = 1000
+SEARCH_LOG_TIMEOUT = 24 * 60 * 60
+SEARCH_LOG_MAX_ROWS = 5000
+
+
+def search_log_key(version):
+	return f"search:changes:{version}"
+
+
+class SharedIndex:
+	"""
+	Base of the in-process indexes. Every worker holds its own copy, stamped
+	with the shared search version it was built at; when another process
+	bumps the version (refresh_search()), the copy catches up on next use
+	from the change log, or is rebuilt when the log has a gap.
+	"""
+
+	def __init__(self):
+		self._lock = threading.RLock()
+		self._built = False
+		self._version = None
+
+	def build(self):
+		with self._lock:
+			version = shared_counter(SEARCH_VERSION_KEY)
+			self._build()
+			self._version = version
+			self._built = True
+
+	def ensure_built(self):
+		version = shared_counter(SEARCH_VERSION_KEY)
+		if self._built and self._version == version:
+			return
+		with self._lock:
+			if self._built and self._version is not None and 0 < version - self._version <= SEARCH_LOG_LENGTH:
+				keys = [search_log_key(logged) for logged in range(self._version + 1 , version + 1)]
+				changes = cache.get_many(keys)
+				if len(changes) == len(keys):
+					product_ids = set()
+					names = set()
+					for change in changes.values():
+						product_ids.update(change["products"])
+						names.update(map(tuple , change["names"]))
+					self.catch_up(product_ids , names)
+					self._version = version
+					return
+			self.build()
+
+	def catch_up(self , product_ids , names):
+		"""
+		Re-read the rows changed since this copy's version.
+		"""
+		raise NotImplementedError
+
+	def advance(self , version):
+		# This process applied the change itself, so its copy is current
+		# unless a change from elsewhere slipped in before the bump
+		with self._lock:
+			if self._built and self._version == version - 1:
+				self._version = version
+
+
+class ProductSearchIndex(SharedIndex):
+	"""
+	In-process inverted index over the product catalog.
+
+	Built lazily on first search and kept current by refresh_search() (see
+	SharedIndex), so searches never scan the product table.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self._postings = defaultdict(dict)  # token -> {product_id: weight}
+		self._documents = {}  # product_id -> {token: weight}
+		self._vocabulary = []  # sorted tokens, for prefix lookups
+
+	def _build(self):
+		self._postings = defaultdict(dict)
+		self._documents = {}
+		for product_id , fields in product_documents():
+			self._add(product_id , fields)
+		self._vocabulary = sorted(self._postings)
+
+	def refresh(self , product_ids):
+		"""
+		Re-read the given products from the database and update their entries.
+		"""
+		product_ids = set(product_ids)
+		if not self._built or not product_ids:
+			return
+		with self._lock:
+			for product_id in product_ids:
+				self._remove(product_id)
+			for product_id , fields in product_documents(product_ids):
+				self._add(product_id , fields , keep_vocabulary_sorted=True)
+
+	def catch_up(self , product_ids , names):
+		self.refresh(product_ids)
+
+	def remove(self , product_id):
+		if not self._built:
+			return
+		with self._lock:
+			self._remove(product_id)
+
+	def search(self , query):
+		"""
+		Return [(product_id, score), ...] best first, or None for an empty query.
+		Every query term has to match the product in at least one field.
+		"""
+		terms = tokenize(query)
+		if not terms:
+			return None
+
+		self.ensure_built()
+		with self._lock:
+			scores = None
+			for term in dict.fromkeys(terms):
+				term_scores = {}
+				for token in self._expand(term):
+					factor = 1.0 if token == term else PREFIX_MATCH_FACTOR
+					for product_id , weight in self._postings[token].items():
+						weight *= factor
+						if weight > term_scores.get(product_id , 0):
+							term_scores[product_id] = weight
+
+				if scores is None:
+					scores = term_scores
+				else:
+					scores = {
+						product_id: scores[product_id] + weight
+						for product_id , weight in term_scores.items()
+						if product_id in scores
+					}
+				if not scores:
+					return []
+
+		return sorted(scores.items() , key=lambda item: (-item[1] , item[0]))
+
+	def _add(self , product_id , fields , keep_vocabulary_sorted=False):
+		weights = defaultdict(float)
+		for field , text in fields.items():
+			counts = defaultdict(int)
+			for token in tokenize(text):
+				counts[token] += 1
+			for token , count in counts.items():
+				weights[token] += FIELD_WEIGHTS[field] * (1 + math.log(count))
+
+		for token , weight in weights.items():
+			if keep_vocabulary_sorted and token not in self._postings:
+				insort(self._vocabulary , token)
+			self._postings[token][product_id] = weight
+		self._documents[product_id] = weights
+
+	def _remove(self , product_id):
+		for token in self._documents.pop(product_id , ()):
+			postings = self._postings.get(token)
+			if postings is None:
+				continue
+			postings.pop(product_id , None)
+			if not postings:
+				del self._postings[token]
+				position = bisect_left(self._vocabulary , token)
+				if position < len(self._vocabulary) and self._vocabulary[position] == token:
+					del self._vocabulary[position]
+
+	def _expand(self , term):
+		position = bisect_left(self._vocabulary , term)
+		while position < len(self._vocabulary) and self._vocabulary[position].startswith(term):
+			yield self._vocabulary[position]
+			position += 1
+
+
+product_index = ProductSearchIndex()
+
+
+def names_by_kind(names):
+	by_kind = defaultdict(set)
+	for kind , pk in names:
+		by_kind[kind].add(pk)
+	return by_kind
+
+
+def trigrams(token):
+	padded = f"  {token} "
+	return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex(SharedIndex):
+	"""
+	In-process trigram index over product, brand and salt names, used for
+	typo-tolerant matching ("abirateron" -> "Abiraterone Acetate").
+
+	Names are split into tokens and each query token is compared with the
+	indexed tokens by trigram similarity, so only tokens sharing at least one
+	trigram with the query are ever looked at.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self._entries = {}  # (type, id) -> {"name", "slug", "tokens"}
+		self._token_entries = defaultdict(set)  # token -> {(type, id)}
+		self._token_sizes = {}  # token -> number of trigrams
+		self._trigram_tokens = defaultdict(set)  # trigram -> {token}
+
+	def _build(self):
+		self._entries = {}
+		self._token_entries = defaultdict(set)
+		self._token_sizes = {}
+		self._trigram_tokens = defaultdict(set)
+		for kind , (model , fields) in NAME_SOURCES.items():
+			for row in model.objects.values(*fields).iterator(chunk_size=1000):
+				self._add(kind , row)
+
+	def refresh(self , kind , pks):
+		pks = set(pks)
+		if not self._built or not pks:
+			return
+		model , fields = NAME_SOURCES[kind]
+		with self._lock:
+			for pk in pks:
+				self._remove((kind , pk))
+			for row in model.objects.filter(pk__in=pks).values(*fields):
+				self._add(kind , row)
+
+	def catch_up(self , product_ids , names):
+		for kind , pks in names_by_kind(names).items():
+			self.refresh(kind , pks)
+
+	def remove(self , kind , pk):
+		if not self._built:
+			return
+		with self._lock:
+			self._remove((kind , pk))
+
+	def match(self , query , limit=10 , kinds=None , threshold=TRIGRAM_THRESHOLD):
+		"""
+		Return up to `limit` best matching names as dicts with type, id, name,
+		slug and a 0..1 score (mean best token similarity per query token).
+		"""
+		terms = list(dict.fromkeys(tokenize(query)))
+		if not terms:
+			return []
+
+		self.ensure_built()
+		with self._lock:
+			entry_scores = defaultdict(float)
+			for term in terms:
+				best = {}
+				for token , similarity in self._similar_tokens(term , threshold):
+					for key in self._token_entries[token]:
+						if similarity > best.get(key , 0):
+							best[key] = similarity
+				for key , similarity in best.items():
+					if kinds is None or key[0] in kinds:
+						entry_scores[key] += similarity
+
+			top = heapq.nlargest(limit , entry_scores.items() , key=lambda item: (item[1] , -item[0][1]))
+			return [
+				{
+					"type": kind ,
+					"id": pk ,
+					"name": self._entries[(kind , pk)]["name"] ,
+					"slug": self._entries[(kind , pk)]["slug"] ,
+					"score": round(score / len(terms) , 3) ,
+				}
+				for (kind , pk) , score in top
+			]
+
+	def correct(self , query , threshold=TRIGRAM_THRESHOLD):
+		"""
+		Replace each query token with its closest indexed name token.
+		Returns None when nothing could be corrected.
+		"""
+		terms = tokenize(query)
+		if not terms:
+			return None
+
+		self.ensure_built()
+		corrected = []
+		with self._lock:
+			for term in terms:
+				if term in self._token_entries:
+					corrected.append(term)
+					continue
+				candidates = list(self._similar_tokens(term , threshold))
+				if not candidates:
+					return None
+				corrected.append(max(candidates , key=lambda item: (item[1] , item[0]))[0])
+
+		if corrected == terms:
+			return None
+		return " ".join(corrected)
+
+	def _similar_tokens(self , term , threshold):
+		term_trigrams = trigrams(term)
+		shared = defaultdict(int)
+		for gram in term_trigrams:
+			for token in self._trigram_tokens.get(gram , ()):
+				shared[token] += 1
+
+		for token , count in shared.items():
+			similarity = count / (len(term_trigrams) + self._token_sizes[token] - count)
+			if similarity >= threshold:
+				yield token , similarity
+
+	def _add(self , kind , row):
+		tokens = set(tokenize(row["name"]))
+		self._entries[(kind , row["id"])] = {
+			"name": row["name"] ,
+			"slug": row.get("slug") ,
+			"tokens": tokens ,
+		}
+		for token in tokens:
+			if token not in self._token_entries:
+				token_trigrams = trigrams(token)
+				self._token_sizes[token] = len(token_trigrams)
+				for gram in token_trigrams:
+					self._trigram_tokens[gram].add(token)
+			self._token_entries[token].add((kind , row["id"]))
+
+	def _remove(self , key):
+		entry = self._entries.pop(key , None)
+		if entry is None:
+			return
+		for token in entry["tokens"]:
+			keys = self._token_entries.get(token)
+			if keys is None:
+				continue
+			keys.discard(key)
+			if keys:
+				continue
+			del self._token_entries[token]
+			del self._token_sizes[token]
+			for gram in trigrams(token):
+				tokens = self._trigram_tokens.get(gram)
+				if tokens is not None:
+					tokens.discard(token)
+					if not tokens:
+						del self._trigram_tokens[gram]
+
+
+name_index = TrigramIndex()
+
+
+SUGGEST_LABELS = {
+	"product": "Product" ,
+	"brand": "Brand" ,
+	"salt": "Salt" ,
+}
+
+
+# Upper bound on keys scanned per autocomplete lookup, so one-letter
+# prefixes stay cheap on a large catalog.
+SUGGEST_SCAN_LIMIT = 500
+
+
+def normalize_name(name):
+	return " ".join(tokenize(name))
+
+
+class SuggestIndex(SharedIndex):
+	"""
+	Autocomplete over product, brand and salt names.
+
+	Every name is stored once per word start ("abiraterone acetate",
+	"acetate") in one sorted list, so a keystroke is answered with a bisect
+	plus a short forward scan.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self._keys = []  # sorted (key, type, id)
+		self._entries = {}  # (type, id) -> {"name", "slug", "keys"}
+
+	def _build(self):
+		self._keys = []
+		self._entries = {}
+		for kind , (model , fields) in NAME_SOURCES.items():
+			for row in model.objects.values(*fields).iterator(chunk_size=1000):
+				self._add(kind , row)
+		self._keys.sort()
+
+	def refresh(self , kind , pks):
+		pks = set(pks)
+		if not self._built or not pks:
+			return
+		model , fields = NAME_SOURCES[kind]
+		with self._lock:
+			for pk in pks:
+				self._remove((kind , pk))
+			for row in model.objects.filter(pk__in=pks).values(*fields):
+				self._add(kind , row , keep_sorted=True)
+
+	def catch_up(self , product_ids , names):
+		for kind , pks in names_by_kind(names).items():
+			self.refresh(kind , pks)
+
+	def remove(self , kind , pk):
+		if not self._built:
+			return
+		with self._lock:
+			self._remove((kind , pk))
+
+	def suggest(self , query , limit=8):
+		"""
+		Names starting with `query`, or having a word that does. Whole-name
+		prefix matches come first, then alphabetical order.
+		"""
+		prefix = normalize_name(query)
+		if not prefix:
+			return []
+
+		self.ensure_built()
+		with self._lock:
+			matches = {}
+			position = bisect_left(self._keys , (prefix ,))
+			end = min(position + SUGGEST_SCAN_LIMIT , len(self._keys))
+			while position < end:
+				key , kind , pk = self._keys[position]
+				if not key.startswith(prefix):
+					break
+				entry = self._entries[(kind , pk)]
+				is_name_prefix = entry["keys"][0] == key
+				if is_name_prefix or (kind , pk) not in matches:
+					matches[(kind , pk)] = (not is_name_prefix , entry["name"].lower() , pk)
+				position += 1
+
+			ranked = heapq.nsmallest(limit , matches.items() , key=lambda item: item[1])
+			return [
+				{
+					"id": pk ,
+					"slug": self._entries[(kind , pk)]["slug"] ,
+					"name": self._entries[(kind , pk)]["name"] ,
+					"label": SUGGEST_LABELS[kind] ,
+				}
+				for (kind , pk) , rank in ranked
+			]
+
+	def _add(self , kind , row , keep_sorted=False):
+		words = normalize_name(row["name"]).split(" ")
+		keys = list(dict.fromkeys(" ".join(words[i:]) for i in range(len(words)) if words[i]))
+		self._entries[(kind , row["id"])] = {
+			"name": row["name"] ,
+			"slug": row.get("slug") ,
+			"keys": keys ,
+		}
+		for key in keys:
+			if keep_sorted:
+				insort(self._keys , (key , kind , row["id"]))
+			else:
+				self._keys.append((key , kind , row["id"]))
+
+	def _remove(self , entry_key):
+		entry = self._entries.pop(entry_key , None)
+		if entry is None:
+			return
+		for key in entry["keys"]:
+			item = (key ,) + entry_key
+			position = bisect_left(self._keys , item)
+			if position < len(self._keys) and self._keys[position] == item:
+				del self._keys[position]
+
+
+suggest_index = SuggestIndex()
+
+
+def refresh_search(product_ids=() , names=()):
+	"""
+	Re-read changed rows into this process's indexes, bump the shared
+	search version and log the changed rows under it so the other workers
+	catch up (see SharedIndex). `names` holds (type, pk) pairs for
+	NAME_SOURCES; rows that no longer exist are dropped. Call it once the
+	writes are committed, bulk writes that send no signals included.
+	"""
+	product_ids = list(dict.fromkeys(product_ids))
+	names = list(dict.fromkeys(names))
+	product_index.refresh(product_ids)
+	for kind , pks in names_by_kind(names).items():
+		name_index.refresh(kind , pks)
+		suggest_index.refresh(kind , pks)
+
+	version = bump_shared_counter(SEARCH_VERSION_KEY)
+	if len(product_ids) + len(names) <= SEARCH_LOG_MAX_ROWS:
+		cache.set(
+			search_log_key(version) ,
+			{"products": product_ids , "names": names} ,
+			timeout=SEARCH_LOG_TIMEOUT
+		)
+	for index in (product_index , name_index , suggest_index):
+		index.advance(version)
+
+
+class ProductSearchFilter(filters.SearchFilter):
+	"""
+	Drop-in replacement for SearchFilter on ProductViewSet that answers
+	`?search=` from the in-memory index. Misspelt queries are retried once
+	with names corrected through the trigram index.
+
+	The queryset is only narrowed to the hits; their relevance scores are
+	left on the view as `search_ranking` so that ProductPagination can rank
+	and slice the ids in Python and load just one page of rows. An explicit
+	`?ordering=` still takes precedence.
+	"""
+
+	def filter_queryset(self , request , queryset , view):
+		query = request.query_params.get(self.search_param , "")
+		ranked = product_index.search(query)
+		if ranked is None:
+			return queryset
+		if not ranked:
+			corrected = name_index.correct(query)
+			if corrected:
+				ranked = product_index.search(corrected)
+		if not ranked:
+			return queryset.none()
+
+		view.search_ranking = dict(ranked)
+		return queryset.filter(pk__in=view.search_ranking)
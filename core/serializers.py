@@ -4,12 +4,78 @@ from .models import (
 	SaltComposition , Product , ProductImage ,
 	Address , Cart , Wishlist , Order , OrderItem ,
 )
+from .utils import parse_list_param
+from .images import variant_urls
+
+
+class SparseFieldsetMixin:
+	"""
+	`?fields=a,b` limits the output to those fields and `?expand=x` swaps the
+	string form of relation `x` for the nested serializer returned by
+	get_expandable_fields().
+	"""
+	
+	def __init__(self , *args , **kwargs):
+		super().__init__(*args , **kwargs)
+		request = self.context.get("request")
+		if request is None:
+			return
+		
+		expand = parse_list_param(request , "expand")
+		if expand:
+			expandable = self.get_expandable_fields()
+			expand &= set(expandable)
+			for name in expand:
+				self.fields[name] = expandable[name]
+		
+		requested = parse_list_param(request , "fields")
+		if requested:
+			for name in set(self.fields) - requested - expand:
+				self.fields.pop(name)
+	
+	def get_expandable_fields(self):
+		return {}
+
+
+class RenderedHTMLField(serializers.Field):
+	"""
+	Serves a RichText field from the sanitized HTML stored on save
+	(RenderedRichTextModel.rendered_html) instead of the raw column.
+	"""
+	
+	def __init__(self , **kwargs):
+		kwargs["source"] = "rendered_html"
+		kwargs["read_only"] = True
+		super().__init__(**kwargs)
+	
+	def to_representation(self , value):
+		return value.get(self.field_name)
+
+
+class RenderedRichTextMixin:
+	"""
+	Swap the model's `richtext_fields` for their pre-rendered HTML.
+	"""
+	
+	def get_fields(self):
+		fields = super().get_fields()
+		for name in self.Meta.model.richtext_fields:
+			if name in fields:
+				fields[name] = RenderedHTMLField()
+		return fields
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+	# Resized WebP/JPEG derivatives: {size: {width, height, webp, jpeg}}
+	variants = serializers.SerializerMethodField()
+	
 	class Meta:
 		model = ProductImage
-		fields = ["id" , "image"]
+		# width/height/dominant_color/lqip let clients reserve and paint the box early
+		fields = ["id" , "image" , "variants" , "width" , "height" , "dominant_color" , "lqip"]
+	
+	def get_variants(self , obj):
+		return variant_urls(obj.variants , obj.image.storage , self.context.get("request"))
 
 
 # class ReviewSerializer(serializers.ModelSerializer):
@@ -21,7 +87,7 @@ class ProductImageSerializer(serializers.ModelSerializer):
 #         # fields = ["id", "rating", "comment", "created_at"]
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin , RenderedRichTextMixin , serializers.ModelSerializer):
 	images = ProductImageSerializer(many=True , read_only=True)
 	# reviews = ReviewSerializer(many=True, read_only=True)
 	brand = serializers.StringRelatedField(read_only=True)
@@ -33,7 +99,26 @@ class ProductSerializer(serializers.ModelSerializer):
 	
 	class Meta:
 		model = Product
-		fields = "__all__"
+		exclude = ["rendered_html" , "plain_text" , "salt_signature"]
+	
+	def get_expandable_fields(self):
+		return {
+			"brand": BrandSerializer(read_only=True) ,
+			"manufacturer": ManufacturerSerializer(read_only=True) ,
+			"salt_compositions": SaltCompositionSerializer(many=True , read_only=True) ,
+			"subcategory": SubCategorySerializer(read_only=True) ,
+		}
+
+
+class ProductListSerializer(ProductSerializer):
+	# Product grid payload: no RichText columns, just the plain-text excerpt
+	class Meta:
+		model = Product
+		fields = [
+			"id" , "name" , "slug" , "brand" , "strength" , "packing" , "form" ,
+			"base_price" , "selling_price" , "discount_percentage" ,
+			"bestseller" , "prescription_required" , "available" , "images" , "excerpt" ,
+		]
 
 
 class SubCategorySerializer(serializers.ModelSerializer):
@@ -50,22 +135,27 @@ class CategorySerializer(serializers.ModelSerializer):
 		fields = ["id" , "name" , "slug" , "subcategories"]
 
 
-class BrandSerializer(serializers.ModelSerializer):
+class BrandSerializer(RenderedRichTextMixin , serializers.ModelSerializer):
+	logo_variants = serializers.SerializerMethodField()
+	
 	class Meta:
 		model = Brand
-		fields = "__all__"
+		exclude = ["rendered_html" , "plain_text"]
+	
+	def get_logo_variants(self , obj):
+		return variant_urls(obj.logo_variants , obj.logo.storage , self.context.get("request"))
 
 
-class ManufacturerSerializer(serializers.ModelSerializer):
+class ManufacturerSerializer(RenderedRichTextMixin , serializers.ModelSerializer):
 	class Meta:
 		model = Manufacturer
-		fields = "__all__"
+		exclude = ["rendered_html" , "plain_text"]
 
 
-class SaltCompositionSerializer(serializers.ModelSerializer):
+class SaltCompositionSerializer(RenderedRichTextMixin , serializers.ModelSerializer):
 	class Meta:
 		model = SaltComposition
-		fields = "__all__"
+		exclude = ["rendered_html" , "plain_text"]
 
 
 class AddressSerializer(serializers.ModelSerializer):
@@ -83,12 +173,18 @@ class CartSerializer(serializers.ModelSerializer):
 		model = Cart
 		fields = "__all__"
 		read_only_fields = ["user"]
+		# Relations read by the method fields (see core.planner)
+		select_related = ["product"]
+		prefetch_related = ["product__images"]
 	
 	def get_product_detail(self , obj):
 		first_image = None
-		image = obj.product.images.first()
+		image_variants = {}
+		# Lowest pk, as images.first() would give, but from the prefetch
+		image = min(obj.product.images.all() , key=lambda image: image.pk , default=None)
 		if image:
 			first_image = image.image.url
+			image_variants = variant_urls(image.variants , image.image.storage , self.context.get("request"))
 		
 		return {
 			"id": obj.product.id ,
@@ -96,9 +192,14 @@ class CartSerializer(serializers.ModelSerializer):
 			"base_price": obj.product.base_price ,
 			"selling_price": obj.product.selling_price ,
 			"image": first_image ,
+			"image_variants": image_variants ,
 		}
 	
 	def get_line_total(self , obj):
+		if hasattr(obj , "line_total"):
+			return obj.line_total  # annotated by CartQuerySet.with_totals
+		if obj.product.selling_price is None:
+			return None
 		return obj.product.selling_price * obj.quantity
 
 
@@ -109,6 +210,7 @@ class WishlistSerializer(serializers.ModelSerializer):
 		model = Wishlist
 		fields = "__all__"
 		read_only_fields = ["user"]
+		select_related = ["product"]
 	
 	def get_product_detail(self , obj):
 		return {
@@ -133,6 +235,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 			"product_detail" ,
 		]
 		read_only_fields = ["price"]
+		select_related = ["product"]
 	
 	def get_product_detail(self , obj):
 		return {
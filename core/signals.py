@@ -1,22 +1,194 @@
-from django.db.models.signals import pre_save
+import logging
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Category, SubCategory, Product
+from .models import Category, SubCategory, Brand, Manufacturer, SaltComposition, Product, ProductImage
 from .utils import generate_unique_slug
+from .search import refresh_search, PRODUCT_INDEXED_FIELDS
+from .caching import bump_catalog_generation, invalidate_category_tree
+from .images import refresh_variants, EMPTY_METADATA
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(pre_save, sender=Category)
 def category_slug_handler(sender, instance, **kwargs):
-    if not instance.slug or instance.name:
+    if not instance.slug:
         instance.slug = generate_unique_slug(instance, instance.name)
 
 
 @receiver(pre_save, sender=SubCategory)
 def subcategory_slug_handler(sender, instance, **kwargs):
-    if not instance.slug or instance.name:
+    if not instance.slug:
         instance.slug = generate_unique_slug(instance, instance.name)
 
 
 @receiver(pre_save, sender=Product)
 def product_slug_handler(sender, instance, **kwargs):
-    if not instance.slug or instance.name:
+    if not instance.slug:
         instance.slug = generate_unique_slug(instance, instance.name)
+
+
+# ---------------------------------------------------------
+# SEARCH INDEX
+# ---------------------------------------------------------
+
+def reindex_products(product_ids):
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: refresh_search(product_ids=product_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_search_handler(sender, instance, update_fields=None, **kwargs):
+    # Stock and price writes (checkout, imports) leave the indexes alone
+    if update_fields is not None and not PRODUCT_INDEXED_FIELDS & set(update_fields):
+        return
+    # refresh_search() drops rows that no longer exist, which covers deletes
+    product_id = instance.pk
+    transaction.on_commit(lambda: refresh_search(product_ids=[product_id], names=[("product", product_id)]))
+
+
+@receiver(m2m_changed, sender=Product.salt_compositions.through)
+def product_salts_search_handler(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        reindex_products([instance.pk])
+    elif reverse and action in ("post_add", "post_remove"):
+        reindex_products(pk_set)
+    elif reverse and action == "pre_clear":
+        reindex_products(instance.products.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=SaltComposition)
+@receiver(pre_delete, sender=Brand)
+@receiver(pre_delete, sender=SaltComposition)
+def related_search_handler(sender, instance, **kwargs):
+    product_ids = list(instance.products.values_list("pk", flat=True))
+    # refresh_search() drops rows that no longer exist, which covers deletes too
+    names = [("brand" if sender is Brand else "salt", instance.pk)]
+    transaction.on_commit(lambda: refresh_search(product_ids=product_ids, names=names))
+
+
+# ---------------------------------------------------------
+# RESPONSE CACHE
+# ---------------------------------------------------------
+
+CATALOG_MODELS = (Category, SubCategory, Brand, Manufacturer, SaltComposition, Product, ProductImage)
+
+
+def catalog_changed_handler(sender, **kwargs):
+    transaction.on_commit(bump_catalog_generation)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(catalog_changed_handler, sender=model, dispatch_uid=f"catalog_cache_save_{model.__name__}")
+    post_delete.connect(catalog_changed_handler, sender=model, dispatch_uid=f"catalog_cache_delete_{model.__name__}")
+
+m2m_changed.connect(
+    catalog_changed_handler,
+    sender=Product.salt_compositions.through,
+    dispatch_uid="catalog_cache_product_salts",
+)
+
+
+# ---------------------------------------------------------
+# CATEGORY TREE
+# ---------------------------------------------------------
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_delete, sender=Product)
+def category_tree_handler(sender, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+@receiver(post_save, sender=Product)
+def product_subcategory_handler(sender, instance, created, **kwargs):
+    if "subcategory_id" in instance.get_deferred_fields():
+        return
+    if created or instance.subcategory_id != getattr(instance, "_loaded_subcategory_id", None):
+        transaction.on_commit(invalidate_category_tree)
+    instance._loaded_subcategory_id = instance.subcategory_id
+
+
+# ---------------------------------------------------------
+# GENERIC SUBSTITUTES
+# ---------------------------------------------------------
+
+def refresh_salt_signatures(product_ids):
+    Product.objects.filter(pk__in=list(product_ids)).refresh_salt_signatures()
+
+
+@receiver(m2m_changed, sender=Product.salt_compositions.through)
+def product_salts_signature_handler(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        refresh_salt_signatures([instance.pk])
+    elif reverse and action in ("post_add", "post_remove"):
+        refresh_salt_signatures(pk_set)
+    elif reverse and action == "pre_clear":
+        instance._signature_product_ids = list(instance.products.values_list("pk", flat=True))
+    elif reverse and action == "post_clear":
+        refresh_salt_signatures(getattr(instance, "_signature_product_ids", []))
+
+
+@receiver(post_save, sender=SaltComposition)
+def salt_signature_save_handler(sender, instance, created, **kwargs):
+    if not created:
+        refresh_salt_signatures(instance.products.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=SaltComposition)
+def salt_signature_pre_delete_handler(sender, instance, **kwargs):
+    instance._signature_product_ids = list(instance.products.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=SaltComposition)
+def salt_signature_delete_handler(sender, instance, **kwargs):
+    refresh_salt_signatures(getattr(instance, "_signature_product_ids", []))
+
+
+# ---------------------------------------------------------
+# IMAGE VARIANTS
+# ---------------------------------------------------------
+
+def refresh_image_variants(model, pk, field, variants_field, metadata=False):
+    instance = model._base_manager.filter(pk=pk).only(field).first()
+    if instance is None:
+        return
+    values = {}
+    try:
+        if metadata:
+            values[variants_field], image_metadata = refresh_variants(getattr(instance, field), metadata=True)
+            values.update(image_metadata)
+        else:
+            values[variants_field] = refresh_variants(getattr(instance, field))
+    except OSError:
+        logger.exception("Could not generate variants for %s %s", model.__name__, pk)
+        values = {variants_field: {}, **(EMPTY_METADATA if metadata else {})}
+    model._base_manager.filter(pk=pk).update(**values)
+    bump_catalog_generation()
+
+
+def image_variants_handler(field, variants_field, metadata=False):
+    def handler(sender, instance, **kwargs):
+        if {field, variants_field} & instance.get_deferred_fields():
+            return
+        # Regenerate only when the stored file changed
+        if (getattr(instance, field).name or None) != getattr(instance, variants_field).get("source"):
+            pk = instance.pk
+            transaction.on_commit(lambda: refresh_image_variants(sender, pk, field, variants_field, metadata))
+    return handler
+
+
+post_save.connect(
+    image_variants_handler("image", "variants", metadata=True),
+    sender=ProductImage, weak=False, dispatch_uid="product_image_variants",
+)
+post_save.connect(
+    image_variants_handler("logo", "logo_variants"),
+    sender=Brand, weak=False, dispatch_uid="brand_logo_variants",
+)
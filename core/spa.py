@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import HttpResponse , Http404
+from django.utils.cache import get_conditional_response , patch_vary_headers
+from django.utils._os import safe_join
+
+try:
+	import brotli
+except ImportError:  # optional: without it only gzip is offered
+	brotli = None
+
+# How often a cached file's mtime is checked; with DEBUG, on every request
+RELOAD_INTERVAL = 2
+
+# Bundler output names carry a content hash: main.3f2a9c1e.js, index-BmX8Kq2Z.css
+HASHED_NAME = re.compile(r"[.-](?=[0-9A-Za-z_]*[0-9])[0-9A-Za-z_]{8,}\.[0-9a-z]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Worth compressing; images and fonts are already compressed
+COMPRESSIBLE_TYPES = re.compile(r"^(text/|application/(javascript|json|xml|manifest\+json)|image/svg\+xml)")
+MIN_COMPRESS_SIZE = 512
+
+
+class BuildFile:
+	"""
+	A build file held in memory together with its gzip and brotli encodings
+	and a strong ETag per encoding.
+	"""
+	
+	def __init__(self , path):
+		self.path = path
+		stat = os.stat(path)
+		self.mtime = stat.st_mtime_ns
+		self.checked = time.monotonic()
+		
+		with open(path , "rb") as f:
+			body = f.read()
+		self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+		if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+			self.content_type += "; charset=utf-8"
+		
+		digest = hashlib.sha1(body).hexdigest()[:16]
+		self.encodings = {"identity": (body , f'"{digest}"')}
+		if len(body) >= MIN_COMPRESS_SIZE and COMPRESSIBLE_TYPES.match(self.content_type):
+			self.encodings["gzip"] = (gzip.compress(body , compresslevel=9 , mtime=0) , f'"{digest}-gz"')
+			if brotli is not None:
+				self.encodings["br"] = (brotli.compress(body) , f'"{digest}-br"')
+	
+	def is_stale(self):
+		now = time.monotonic()
+		if not settings.DEBUG and now - self.checked < RELOAD_INTERVAL:
+			return False
+		self.checked = now
+		try:
+			return os.stat(self.path).st_mtime_ns != self.mtime
+		except FileNotFoundError:
+			return True
+	
+	def negotiate(self , request):
+		"""
+		Pick br, then gzip, then identity from Accept-Encoding.
+		"""
+		accepted = set()
+		for item in request.META.get("HTTP_ACCEPT_ENCODING" , "").split(","):
+			coding , _ , params = item.strip().partition(";")
+			if params.strip().replace(" " , "") in ("q=0" , "q=0.0" , "q=0.00" , "q=0.000"):
+				continue
+			accepted.add(coding.strip().lower())
+		for encoding in ("br" , "gzip"):
+			if encoding in self.encodings and (encoding in accepted or "*" in accepted):
+				return encoding
+		return "identity"
+	
+	def response(self , request , cache_control):
+		encoding = self.negotiate(request)
+		body , etag = self.encodings[encoding]
+		
+		response = get_conditional_response(request , etag=etag)
+		if response is None:
+			response = HttpResponse(body , content_type=self.content_type)
+			if encoding != "identity":
+				response["Content-Encoding"] = encoding
+		response["ETag"] = etag
+		response["Cache-Control"] = cache_control
+		if len(self.encodings) > 1:
+			patch_vary_headers(response , ["Accept-Encoding"])
+		return response
+
+
+class BuildCache:
+	"""
+	Process-wide cache of BuildFile objects by absolute path.
+	"""
+	
+	def __init__(self):
+		self.files = {}
+		self.lock = threading.Lock()
+	
+	def get(self , path):
+		build_file = self.files.get(path)
+		if build_file is not None and not build_file.is_stale():
+			return build_file
+		with self.lock:
+			current = self.files.get(path)
+			if current is not None and current is not build_file:
+				return current  # another thread reloaded it meanwhile
+			try:
+				build_file = BuildFile(path)
+			except (FileNotFoundError , IsADirectoryError , NotADirectoryError):
+				self.files.pop(path , None)
+				return None
+			self.files[path] = build_file
+		return build_file
+
+
+build_cache = BuildCache()
+
+
+def shell_response(request):
+	"""
+	The SPA shell (index.html). Browsers revalidate it on every load so a
+	deploy is picked up at once; a 304 costs no disk access.
+	"""
+	build_file = build_cache.get(os.path.join(settings.REACT_BUILD_DIR , "index.html"))
+	if build_file is None:
+		return None
+	return build_file.response(request , "no-cache")
+
+
+def asset_response(request , path):
+	try:
+		full_path = safe_join(settings.REACT_BUILD_DIR , path)
+	except SuspiciousFileOperation:
+		raise Http404
+	build_file = build_cache.get(full_path)
+	if build_file is None:
+		raise Http404
+	cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path) else "no-cache"
+	return build_file.response(request , cache_control)
@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.views.static import serve
+
+HASHED_DIR = "hashed"
+
+# A content-addressed file never changes under its name
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+	"""
+	Name every upload after the SHA-256 of its bytes:
+	hashed/<first two hex digits>/<digest><ext>. Saving content that is
+	already stored writes nothing and returns the existing name, so
+	re-uploads and copies share one file, and the file behind a URL never
+	changes (see IMMUTABLE_CACHE_CONTROL).
+	
+	Shared files mean a name can be referenced by several rows; they are
+	never deleted when a row goes away.
+	"""
+	
+	def __init__(self , **kwargs):
+		# Two racing writes of a name always carry identical bytes
+		kwargs.setdefault("allow_overwrite" , True)
+		super().__init__(**kwargs)
+	
+	def hashed_name(self , name , content):
+		digest = hashlib.sha256()
+		content.seek(0)
+		for chunk in content.chunks():
+			digest.update(chunk)
+		content.seek(0)
+		hexdigest = digest.hexdigest()
+		extension = os.path.splitext(name)[1].lower()
+		return f"{HASHED_DIR}/{hexdigest[:2]}/{hexdigest}{extension}"
+	
+	def save(self , name , content , max_length=None):
+		if name is None:
+			name = content.name
+		if not hasattr(content , "chunks"):
+			content = File(content , name)
+		name = self.hashed_name(name , content)
+		if self.exists(name):
+			return name
+		return super().save(name , content , max_length=max_length)
+	
+	def delete(self , name):
+		# Other rows may point at the same content
+		pass
+
+
+image_storage = ContentHashStorage()
+
+
+def serve_hashed_media(request , path , document_root=None):
+	"""
+	django.views.static.serve for content-addressed media, marked immutable.
+	Only wired up with DEBUG; in production the web server serving MEDIA_ROOT
+	should send the same header for MEDIA_URL + "hashed/".
+	"""
+	response = serve(request , f"{HASHED_DIR}/{path}" , document_root=document_root)
+	response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+	return response
@@ -1,3 +1,256 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase , TestCase , TransactionTestCase , override_settings
+from rest_framework.test import APIClient
+
+from .models import Cart , Product
+from .richtext import render_richtext
+from .search import SEARCH_VERSION_KEY , ProductSearchIndex , shared_counter
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CartConcurrencyTests(TransactionTestCase):
+	"""
+	Parallel add-to-cart requests for one user and product must end as a
+	single cart line whose quantity is every accepted request, capped by stock.
+	"""
+	
+	THREADS = 8
+	
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(email="buyer@example.com" , password="secret")
+		self.product = Product.objects.create(name="Paracetamol 500mg" , stock=5 , selling_price=10)
+	
+	def post_in_parallel(self , payload):
+		barrier = threading.Barrier(self.THREADS)
+		statuses = []
+		
+		def worker():
+			client = APIClient()
+			client.force_authenticate(self.user)
+			try:
+				barrier.wait()
+				statuses.append(client.post("/api/cart/" , payload , format="json").status_code)
+			finally:
+				connection.close()
+		
+		threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return statuses
+	
+	def test_parallel_adds_make_one_line(self):
+		statuses = self.post_in_parallel({"product": self.product.pk , "quantity": 1})
+		
+		lines = Cart.objects.filter(user=self.user , product=self.product)
+		self.assertEqual(lines.count() , 1)
+		self.assertEqual(lines.get().quantity , 5)
+		self.assertEqual(statuses.count(201) , 1)
+		self.assertEqual(statuses.count(200) , 4)
+		self.assertEqual(statuses.count(400) , 3)
+	
+	def test_parallel_adds_never_exceed_stock(self):
+		statuses = self.post_in_parallel({"product": self.product.pk , "quantity": 2})
+		
+		line = Cart.objects.get(user=self.user , product=self.product)
+		self.assertEqual(line.quantity , 4)
+		self.assertEqual(statuses.count(400) , self.THREADS - 2)
+	
+	def test_rejects_unavailable_product(self):
+		Product.objects.filter(pk=self.product.pk).update(available=False)
+		client = APIClient()
+		client.force_authenticate(self.user)
+		
+		response = client.post("/api/cart/" , {"product": self.product.pk , "quantity": 1} , format="json")
+		
+		self.assertEqual(response.status_code , 400)
+		self.assertFalse(Cart.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CartBatchTests(TestCase):
+	"""
+	POST /cart/batch/ applies every operation or none of them.
+	"""
+	
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(email="buyer@example.com" , password="secret")
+		self.first = Product.objects.create(name="Paracetamol 500mg" , stock=5 , selling_price=10)
+		self.second = Product.objects.create(name="Cetirizine 10mg" , stock=3 , selling_price=4)
+		self.third = Product.objects.create(name="Ibuprofen 400mg" , stock=2 , selling_price=6)
+		Cart.objects.create(user=self.user , product=self.first , quantity=1)
+		Cart.objects.create(user=self.user , product=self.third , quantity=2)
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+	
+	def post_batch(self , *operations):
+		operations = [{"op": op , "product": product.pk , "quantity": quantity} for op , product , quantity in operations]
+		return self.client.post("/api/cart/batch/" , {"operations": operations} , format="json")
+	
+	def quantities(self):
+		return dict(Cart.objects.filter(user=self.user).values_list("product_id" , "quantity"))
+	
+	def test_updates_inserts_and_removes_lines(self):
+		response = self.post_batch(
+			("increment" , self.first , 2) ,
+			("set" , self.second , 3) ,
+			("remove" , self.third , 0) ,
+		)
+		
+		self.assertEqual(response.status_code , 200)
+		self.assertEqual(self.quantities() , {self.first.pk: 3 , self.second.pk: 3})
+		self.assertEqual(response.data["count"] , 2)
+		self.assertEqual(response.data["total_amount"] , 42)
+	
+	def test_rejects_the_whole_batch_past_stock(self):
+		response = self.post_batch(
+			("set" , self.second , 1) ,
+			("increment" , self.first , 5) ,
+		)
+		
+		self.assertEqual(response.status_code , 400)
+		self.assertEqual(response.data["errors"][0]["product"] , self.first.pk)
+		self.assertEqual(response.data["errors"][0]["available"] , 5)
+		self.assertEqual(self.quantities() , {self.first.pk: 1 , self.third.pk: 2})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class KeysetPaginationTests(TestCase):
+	"""
+	Cursor pages over a nullable ordering reach the NULL rows, in both
+	directions, without counting.
+	"""
+	
+	def setUp(self):
+		discounts = [None , 10 , None , 5 , 10 , None , 20 , 5] * 4
+		self.products = [
+			Product.objects.create(name=f"Product {index}" , discount_percentage=discount)
+			for index , discount in enumerate(discounts)
+		]
+	
+	def walk(self , url , direction):
+		pages = []
+		while url:
+			response = APIClient().get(url)
+			self.assertEqual(response.status_code , 200)
+			self.assertNotIn("count" , response.data)
+			pages.append([product["id"] for product in response.data["results"]])
+			last , url = response.data , response.data[direction]
+		return pages , last
+	
+	def test_pages_cross_the_null_boundary(self):
+		pages , last = self.walk("/api/products/?ordering=-discount_percentage" , "next")
+		
+		expected = sorted(
+			self.products ,
+			key=lambda product: (product.discount_percentage is None , -(product.discount_percentage or 0) , -product.pk)
+		)
+		self.assertEqual(sum(pages , []) , [product.pk for product in expected])
+		
+		backwards , first = self.walk(last["previous"] , "previous")
+		self.assertEqual(backwards[::-1] , pages[:-1])
+
+
+class SearchIndexSyncTests(TestCase):
+	"""
+	Another worker's index follows product changes from the change log
+	without rebuilding, and stock writes do not touch the search version.
+	"""
+	
+	def setUp(self):
+		self.product = Product.objects.create(name="Crocin Advance" , stock=3)
+		self.other = ProductSearchIndex()
+		self.other.build()
+	
+	def test_stock_writes_keep_the_version(self):
+		version = shared_counter(SEARCH_VERSION_KEY)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.product.stock = 2
+			self.product.save(update_fields=["stock" , "available"])
+		
+		self.assertEqual(shared_counter(SEARCH_VERSION_KEY) , version)
+	
+	def test_catches_up_without_rebuilding(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			self.product.name = "Dolo 650"
+			self.product.save()
+			added = Product.objects.create(name="Dolo Cold")
+		
+		with mock.patch.object(ProductSearchIndex , "_build") as build:
+			self.assertEqual([pk for pk , score in self.other.search("dolo")] , [self.product.pk , added.pk])
+			self.assertEqual(self.other.search("crocin") , [])
+		self.assertFalse(build.called)
+
+
+class RichTextRendererTests(SimpleTestCase):
+
+	def test_keeps_block_tags_and_text_boundaries(self):
+		html , text = render_richtext("<h1>Title</h1><div>a</div><pre>code</pre><section>b</section>c")
+		
+		self.assertEqual(html , "<h1>Title</h1><div>a</div><pre>code</pre> b c")
+		self.assertEqual(text , "Title\na\ncode\nb\nc")
+	
+	def test_sanitizes_images(self):
+		html , text = render_richtext(
+			'<img src="/media/a.png" alt="Pack" width="200" height="auto" onerror="x()">'
+			'<img src="javascript:alert(1)"><img alt="no source">'
+		)
+		
+		self.assertEqual(html , '<img src="/media/a.png" alt="Pack" width="200">')
+		self.assertEqual(text , "")
+	
+	def test_filters_styles(self):
+		html , text = render_richtext(
+			'<p style="text-align: center; position: fixed; background-color: url(x)">x</p>'
+			'<span style="color: rgb(255, 0, 0)">y</span><p style="behavior: url(x)">z</p>'
+		)
+		
+		self.assertEqual(
+			html ,
+			'<p style="text-align: center">x</p><span style="color: rgb(255, 0, 0)">y</span><p>z</p>'
+		)
+	
+	def test_drops_scripts_and_unsafe_links(self):
+		html , text = render_richtext(
+			'<p onclick="x()">Hi<script>alert(1)</script> <a href="javascript:x()">there</a></p>'
+		)
+		
+		self.assertEqual(html , '<p>Hi <a rel="nofollow noopener">there</a></p>')
+		self.assertEqual(text , "Hi there")
+	
+	def test_closes_unbalanced_tags(self):
+		html , text = render_richtext("<ul><li>one<li>two</ul><p><b>bold")
+		
+		self.assertEqual(html , "<ul><li>one</li><li>two</li></ul><p><b>bold</b></p>")
+		self.assertEqual(text , "one\ntwo\nbold")
+
+
+class RenderedRichTextModelTests(TestCase):
+
+	def test_renders_on_save(self):
+		product = Product.objects.create(name="Crocin" , uses="<p>Fever &amp; <b>pain</b></p>")
+		
+		self.assertEqual(product.rendered_html["uses"] , "<p>Fever &amp; <b>pain</b></p>")
+		self.assertEqual(product.plain_text , "Fever & pain")
+		self.assertEqual(product.excerpt , "Fever & pain")
+	
+	def test_skips_rendering_when_no_source_field_is_saved(self):
+		product = Product.objects.create(name="Crocin" , uses="<p>Fever</p>" , stock=3)
+		product.uses = "<p>Changed</p>"
+		product.stock = 2
+		product.save(update_fields=["stock"])
+		product.refresh_from_db()
+		
+		self.assertEqual(product.stock , 2)
+		self.assertEqual(product.rendered_html["uses"] , "<p>Fever</p>")
+		
+		product.uses = "<p>Changed</p>"
+		product.save(update_fields=["uses"])
+		product.refresh_from_db()
+		
+		self.assertEqual(product.rendered_html["uses"] , "<p>Changed</p>")
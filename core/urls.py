@@ -7,7 +7,7 @@ from .views import (
     CategoryViewSet, SubCategoryViewSet, BrandViewSet, ManufacturerViewSet,
     SaltCompositionViewSet, ProductViewSet, #ReviewViewSet
     AddressViewSet, CartViewSet, WishlistViewSet,
-    OrderViewSet, OrderItemViewSet, CheckoutAPIView
+    OrderViewSet, OrderItemViewSet, CheckoutAPIView, GuestCartView
 )
 
 router = DefaultRouter()
@@ -31,4 +31,6 @@ urlpatterns = [
     path("", include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),
     path("checkout/", CheckoutAPIView.as_view(), name="checkout"),
+    path("guest-cart/", GuestCartView.as_view(), name="guest-cart"),
+    re_path(r"^guest-cart/(?P<token>[A-Za-z0-9_-]{22})/$", GuestCartView.as_view(), name="guest-cart-detail"),
 ]
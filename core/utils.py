@@ -1,16 +1,104 @@
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.utils.text import slugify
 
+# Characters kept free at the end of a max_length-capped base for "-<n>"
+SLUG_SUFFIX_RESERVE = 6
+
+# Attempts at saving with a fresh slug when a concurrent insert took ours
+SLUG_SAVE_ATTEMPTS = 5
+
+
+def allocate_slugs(model, bases, field="slug", separator="-", exclude_pk=None, reserved=()):
+    """
+    Allocate a unique value of `field` for each of `bases` (used as given),
+    suffixing "<separator><n>" on collisions: base, base-1, base-2, ...
+
+    Every value the bases could collide with is read in one startswith
+    query, so this costs a single round-trip however many are taken.
+    Bases repeated in the batch get distinct values.
+    """
+    max_length = model._meta.get_field(field).max_length
+    prefixes = {}
+    for base in bases:
+        base = base or model._meta.model_name
+        prefix = base
+        if max_length and len(base) > max_length - SLUG_SUFFIX_RESERVE:
+            prefix = base[:max_length - SLUG_SUFFIX_RESERVE]
+        prefixes[base] = prefix
+    if not prefixes:
+        return []
+
+    queryset = model._default_manager.filter(
+        reduce(or_, (Q(**{f"{field}__startswith": prefix}) for prefix in set(prefixes.values())))
+    )
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    taken = set(queryset.values_list(field, flat=True))
+    taken.update(reserved)
+
+    allocated = []
+    for base in bases:
+        base = base or model._meta.model_name
+        value, counter = base[:max_length] if max_length else base, 1
+        while value in taken:
+            suffix = f"{separator}{counter}"
+            value = f"{base[:max_length - len(suffix)] if max_length else base}{suffix}"
+            counter += 1
+        taken.add(value)
+        allocated.append(value)
+    return allocated
+
+
+def save_with_unique_slug(instance, base, save, field="slug", separator="-"):
+    """
+    Allocate `field` for `instance` from `base` and run `save()`. When a
+    concurrent insert claims the same value first, the unique constraint
+    rejects ours and we retry with the next free one.
+    """
+    failed = set()
+    for attempt in range(SLUG_SAVE_ATTEMPTS):
+        value = allocate_slugs(
+            type(instance), [base], field=field, separator=separator,
+            exclude_pk=instance.pk, reserved=failed,
+        )[0]
+        setattr(instance, field, value)
+        try:
+            with transaction.atomic(using=instance._state.db):
+                return save()
+        except IntegrityError as error:
+            # Only retry violations that name our column
+            if field not in str(error) or attempt == SLUG_SAVE_ATTEMPTS - 1:
+                raise
+            failed.add(value)
+
+
 def generate_unique_slug(instance, field_value, slug_field_name="slug"):
     """
     Generate a unique slug for a model instance.
     """
-    base_slug = slugify(field_value)
-    slug = base_slug
-    counter = 1
+    return allocate_slugs(
+        instance.__class__, [slugify(field_value)], field=slug_field_name, exclude_pk=instance.pk
+    )[0]
+
+
+def split_list_param(request, name):
+    """
+    Read a comma separated query param (?ids=3,1&ids=2) into a list, in order.
+    """
+    return [
+        item.strip()
+        for value in request.query_params.getlist(name)
+        for item in value.split(",")
+        if item.strip()
+    ]
 
-    ModelClass = instance.__class__
-    while ModelClass.objects.filter(**{slug_field_name: slug}).exclude(pk=instance.pk).exists():
-        slug = f"{base_slug}-{counter}"
-        counter += 1
 
-    return slug
+def parse_list_param(request, name):
+    """
+    Read a comma separated query param (?fields=a,b&fields=c) into a set.
+    """
+    return set(split_list_param(request, name))
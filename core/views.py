@@ -1,56 +1,65 @@
 from django.shortcuts import render , get_object_or_404
 
-import os
+import hashlib
 from django.conf import settings
-from django.http import HttpResponse , JsonResponse
+from django.core.cache import cache
+from django.http import HttpResponse , JsonResponse , StreamingHttpResponse
 from django.views import View
 
 from rest_framework import viewsets , filters , permissions , status
 from rest_framework.response import Response
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import ValidationError
 
-from django.db.models import F , Q , ExpressionWrapper , FloatField
+from django.db.models import Q
 from django.db import transaction
 
 from .models import (
 	Category , SubCategory , Brand , Manufacturer ,
 	SaltComposition , Product ,  # Review
-	Address , Cart , Wishlist , Order , OrderItem
+	Address , Cart , Wishlist , Order , OrderItem ,
+	InsufficientStock , fold_cart_operations ,
 )
 from .serializers import (
 	CategorySerializer , SubCategorySerializer , BrandSerializer ,
 	ManufacturerSerializer , SaltCompositionSerializer ,
-	ProductSerializer ,  # ReviewSerializer
+	ProductSerializer , ProductListSerializer ,  # ReviewSerializer
 	AddressSerializer , CartSerializer , WishlistSerializer ,
 	OrderSerializer , OrderItemSerializer , CheckoutSerializer ,
 )
 
 from .filters import ProductFilter
+from .pagination import ProductPagination , OrderPagination , OrderItemPagination
+from .caching import CatalogCacheMixin , ModifiedConditionalMixin , category_tree_response , catalog_generation
+from .utils import parse_list_param , split_list_param
+from .planner import QueryPlanMixin , plan_queryset
+from .facets import product_facets
+from .search import ProductSearchFilter , name_index , suggest_index
+from .export import iter_ndjson , gzip_stream
+from .spa import shell_response , asset_response
+from . import guest_cart
 
 
 # Create your views here.
 
 
 class ReactAppView(View):
-	def get(self , request , *args , **kwargs):
-		index_file = os.path.join(settings.REACT_BUILD_DIR , "index.html")
-		if os.path.exists(index_file):
-			with open(index_file , "r" , encoding="utf-8") as f:
-				return HttpResponse(f.read())
+	# Build files and the index.html shell, from memory (see core.spa)
+	def get(self , request , path="" , *args , **kwargs):
+		# Paths with an extension are build files; anything else is a client-side route
+		if "." in path.rsplit("/" , 1)[-1]:
+			return asset_response(request , path)
+		response = shell_response(request)
+		if response is not None:
+			return response
 		return HttpResponse("React build not found. Run `npm run build`." , status=500)
 
 
-# class ProductPagination(PageNumberPagination):
-# 	page_size = 1
-# 	page_size_query_param = 'page_size'  # allow client to set page size
-# 	max_page_size = 100
-
-
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogCacheMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	permission_classes = [permissions.AllowAny]
 	queryset = Category.objects.all().order_by('name')
 	serializer_class = CategorySerializer
@@ -58,11 +67,16 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
 	filter_backends = [filters.SearchFilter , DjangoFilterBackend]
 	filterset_fields = ["slug"]
 	lookup_field = "slug"
+	
+	# Whole menu in one unpaginated response, served from a cached blob
+	@action(detail=False , methods=["get"])
+	def tree(self , request):
+		return category_tree_response(request)
 
 
-class SubCategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class SubCategoryViewSet(CatalogCacheMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	permission_classes = [permissions.AllowAny]
-	queryset = SubCategory.objects.all().select_related("category").order_by('category__name' , 'name')
+	queryset = SubCategory.objects.all().order_by('category__name' , 'name')
 	serializer_class = SubCategorySerializer
 	search_fields = ["name"]
 	filter_backends = [filters.SearchFilter , DjangoFilterBackend]
@@ -71,7 +85,7 @@ class SubCategoryViewSet(viewsets.ReadOnlyModelViewSet):
 	lookup_field = "slug"
 
 
-class BrandViewSet(viewsets.ReadOnlyModelViewSet):
+class BrandViewSet(CatalogCacheMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	permission_classes = [permissions.AllowAny]
 	queryset = Brand.objects.all().order_by('name')
 	serializer_class = BrandSerializer
@@ -80,7 +94,7 @@ class BrandViewSet(viewsets.ReadOnlyModelViewSet):
 	filter_backends = [filters.SearchFilter , DjangoFilterBackend]
 
 
-class ManufacturerViewSet(viewsets.ReadOnlyModelViewSet):
+class ManufacturerViewSet(CatalogCacheMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	permission_classes = [permissions.AllowAny]
 	queryset = Manufacturer.objects.all().order_by('name')
 	serializer_class = ManufacturerSerializer
@@ -88,7 +102,7 @@ class ManufacturerViewSet(viewsets.ReadOnlyModelViewSet):
 	filter_backends = [filters.SearchFilter , DjangoFilterBackend]
 
 
-class SaltCompositionViewSet(viewsets.ReadOnlyModelViewSet):
+class SaltCompositionViewSet(CatalogCacheMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	permission_classes = [permissions.AllowAny]
 	queryset = SaltComposition.objects.all().order_by('name')
 	serializer_class = SaltCompositionSerializer
@@ -96,31 +110,223 @@ class SaltCompositionViewSet(viewsets.ReadOnlyModelViewSet):
 	filter_backends = [filters.SearchFilter , DjangoFilterBackend]
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(CatalogCacheMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	permission_classes = [permissions.AllowAny]
-	queryset = (Product.objects.all().select_related(
-		"subcategory" , "brand" , "manufacturer"
-	).annotate(
-		discount_percentage=ExpressionWrapper(
-			(F('base_price') - F('selling_price')) * 100.0 / F('base_price') ,
-			output_field=FloatField()
-		)
-	).order_by('name'))
+	queryset = Product.objects.all().order_by('name')
 	
 	serializer_class = ProductSerializer
-	# pagination_class = ProductPagination
-	filter_backends = [filters.SearchFilter , filters.OrderingFilter , DjangoFilterBackend]
+	pagination_class = ProductPagination
+	filter_backends = [ProductSearchFilter , filters.OrderingFilter , DjangoFilterBackend]
 	
+	# Served from core.search.product_index (name, brand, salts, uses, benefits, description)
 	search_fields = ["name" , "description" , "uses" , "benefits"]
 	
 	filterset_class = ProductFilter
 	
-	ordering_fields = ["base_price" , "selling_price" , "created_at" , "stock"]
+	ordering_fields = ["base_price" , "selling_price" , "discount_percentage" , "created_at" , "stock"]
 	
 	lookup_field = "slug"
+	
+	bulk_lookup_limit = 500
+	
+	# Columns always read, whatever ?fields= asks for: lookups, cursors and ordering
+	always_loaded_fields = ["id" , "slug" , "name" , *ordering_fields]
+	
+	def get_serializer_class(self):
+		# bulk renders the detail representation, so its cache entries are
+		# the ones retrieve reads and writes
+		if self.action in ("list" , "substitutes") and not parse_list_param(self.request , "fields"):
+			return ProductListSerializer
+		return super().get_serializer_class()
+	
+	def get_queryset(self):
+		queryset = super().get_queryset()
+		if self.action not in ("list" , "retrieve" , "substitutes" , "bulk"):
+			return queryset
+		
+		# Only read the columns the serializer will actually render; joins and
+		# prefetches for them are added by QueryPlanMixin
+		serializer = self.get_serializer_class()(context=self.get_serializer_context())
+		concrete = {field.name for field in Product._meta.concrete_fields}
+		columns = {
+			field.source for field in serializer.fields.values()
+			if field.source in concrete
+		}
+		return queryset.only(*columns , *self.always_loaded_fields)
+	
+	# Cached per product rather than per URL, in the same entries bulk reads
+	# and writes
+	def retrieve(self , request , *args , **kwargs):
+		def compute():
+			prefix = self.product_cache_prefix(self.get_serializer())
+			data = cache.get(f"{prefix}:slugs:{kwargs[self.lookup_field]}")
+			if data is not None:
+				return Response(data , headers={"X-Cache": "HIT"})
+			product = self.get_object()
+			data = self.get_serializer(product).data
+			cache.set_many(
+				{f"{prefix}:ids:{product.pk}": data , f"{prefix}:slugs:{product.slug}": data} ,
+				timeout=settings.CATALOG_CACHE_TIMEOUT
+			)
+			return Response(data , headers={"X-Cache": "MISS"})
+		return self.catalog_response(request , compute , cached=False)
+	
+	# ?facets=true adds facet counts for the active filters next to the page
+	def paginate_queryset(self , queryset):
+		self.facets = None
+		if self.request.query_params.get("facets") in ("1" , "true" , "True"):
+			self.facets = product_facets(self.request , queryset)
+		return super().paginate_queryset(queryset)
+	
+	def get_paginated_response(self , data):
+		response = super().get_paginated_response(data)
+		if self.facets is not None:
+			response.data["facets"] = self.facets
+		return response
+	
+	# Same salts at the same strengths, cheapest first; one lookup on the salt_signature index
+	@action(detail=True , methods=["get"])
+	def substitutes(self , request , slug=None):
+		def compute():
+			product = get_object_or_404(Product.objects.only("pk" , "salt_signature") , slug=slug)
+			queryset = Product.objects.none()
+			if product.salt_signature:
+				queryset = (
+					self.get_queryset()
+					.filter(salt_signature=product.salt_signature)
+					.exclude(pk=product.pk)
+					.order_by("selling_price" , "pk")
+				)
+			serializer = self.get_serializer(plan_queryset(queryset , self.get_serializer()) , many=True)
+			return Response({"count": len(serializer.data) , "results": serializer.data})
+		
+		return self.catalog_response(request , compute)
+	
+	# Batch lookup for cart/wishlist/history screens:
+	# GET ?ids=3,1,2 or ?slugs=a,b, or POST {"ids": [...]} / {"slugs": [...]}
+	@action(detail=False , methods=["get" , "post"])
+	def bulk(self , request):
+		kind , keys = self.get_bulk_keys(request)
+		
+		# Per-product entries, shared with retrieve (same serializer, no
+		# query parameters) and every bulk call with the same representation
+		serializer = self.get_serializer()
+		prefix = self.product_cache_prefix(serializer)
+		cache_keys = {key: f"{prefix}:{kind}:{key}" for key in keys}
+		cached = cache.get_many(cache_keys.values())
+		found = {key: cached[cache_key] for key , cache_key in cache_keys.items() if cache_key in cached}
+		
+		misses = [key for key in keys if key not in found]
+		if misses:
+			lookup = "pk" if kind == "ids" else "slug"
+			queryset = plan_queryset(self.get_queryset().filter(**{f"{lookup}__in": misses}) , serializer)
+			products = list(queryset)
+			data = self.get_serializer(products , many=True).data
+			fresh = {getattr(product , lookup): item for product , item in zip(products , data)}
+			entries = {}
+			for product , item in zip(products , data):
+				entries[f"{prefix}:ids:{product.pk}"] = item
+				entries[f"{prefix}:slugs:{product.slug}"] = item
+			cache.set_many(entries , timeout=settings.CATALOG_CACHE_TIMEOUT)
+			found.update(fresh)
+		
+		return Response({
+			"results": [found[key] for key in keys if key in found] ,
+			"missing": [key for key in keys if key not in found] ,
+		})
+	
+	def product_cache_prefix(self , serializer):
+		"""
+		Prefix of the per-product cache entries. It covers everything that
+		shapes one product's representation: the serializer and its fields,
+		the query parameters (?fields=, ?expand=) and the host absolute URLs
+		are built with.
+		"""
+		params = sorted(
+			(name , sorted(values))
+			for name , values in self.request.query_params.lists()
+			if name not in ("ids" , "slugs")
+		)
+		shape = f"{type(serializer).__name__}:{sorted(serializer.fields)}:{params}:{self.request.build_absolute_uri('/')}"
+		variant = hashlib.sha1(shape.encode()).hexdigest()[:12]
+		return f"catalog:{catalog_generation()}:product:{variant}"
+	
+	def get_bulk_keys(self , request):
+		source = request.data if request.method == "POST" else None
+		for kind in ("ids" , "slugs"):
+			if source is not None:
+				keys = source.get(kind) or []
+				if not isinstance(keys , list):
+					raise ValidationError({kind: "Must be a list."})
+			else:
+				keys = split_list_param(request , kind)
+			if keys:
+				break
+		else:
+			raise ValidationError({"ids": "Provide ids or slugs."})
+		
+		if kind == "ids":
+			try:
+				keys = [int(key) for key in keys]
+			except (TypeError , ValueError):
+				raise ValidationError({"ids": "Ids must be integers."})
+		else:
+			keys = [str(key) for key in keys]
+		
+		keys = list(dict.fromkeys(keys))
+		if len(keys) > self.bulk_lookup_limit:
+			raise ValidationError({kind: f"At most {self.bulk_lookup_limit} keys per request."})
+		return kind , keys
+	
+	# Full catalog as NDJSON for downstream mirrors, streamed with flat memory;
+	# honours the list filters. ?compress=gzip for a .ndjson.gz download.
+	@action(detail=False , methods=["get"])
+	def export(self , request):
+		lines = iter_ndjson(self.filter_queryset(self.get_queryset()))
+		filename = "products.ndjson"
+		if request.query_params.get("compress") == "gzip":
+			response = StreamingHttpResponse(gzip_stream(lines) , content_type="application/gzip")
+			filename += ".gz"
+		else:
+			response = StreamingHttpResponse(lines , content_type="application/x-ndjson")
+		response["Content-Disposition"] = f'attachment; filename="{filename}"'
+		return response
+	
+	@action(detail=False , methods=["get"])
+	def facets(self , request):
+		return Response(product_facets(request , self.filter_queryset(self.get_queryset())))
+	
+	# Typo-tolerant name lookup: /api/products/fuzzy/?q=abirateron&limit=5&type=salt
+	@action(detail=False , methods=["get"])
+	def fuzzy(self , request):
+		query = request.query_params.get("q" , "").strip()
+		try:
+			limit = min(max(int(request.query_params.get("limit" , 10)) , 1) , 50)
+		except ValueError:
+			raise ValidationError({"limit": "Must be an integer."})
+		kinds = request.query_params.getlist("type") or None
+		
+		return Response({
+			"query": query ,
+			"results": name_index.match(query , limit=limit , kinds=kinds) ,
+		})
+	
+	# Search-box autocomplete: /api/products/suggest/?q=abi
+	@action(detail=False , methods=["get"])
+	def suggest(self , request):
+		query = request.query_params.get("q" , "").strip()
+		try:
+			limit = min(max(int(request.query_params.get("limit" , 8)) , 1) , 20)
+		except ValueError:
+			raise ValidationError({"limit": "Must be an integer."})
+		
+		return Response({
+			"query": query ,
+			"results": suggest_index.suggest(query , limit=limit) ,
+		})
 
 
-class AddressViewSet(viewsets.ModelViewSet):
+class AddressViewSet(QueryPlanMixin , viewsets.ModelViewSet):
 	serializer_class = AddressSerializer
 	permission_classes = [permissions.IsAuthenticated]
 	
@@ -131,60 +337,149 @@ class AddressViewSet(viewsets.ModelViewSet):
 		serializer.save(user=self.request.user)
 
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartOperationsMixin:
+	"""
+	Parse {"operations": [{"op": "set" | "increment" | "remove", "product": id,
+	"quantity": n}, ...]} into (op, product_id, quantity) tuples.
+	"""
+	
+	batch_limit = 100
+	
+	def get_batch_operations(self , request):
+		operations = request.data.get("operations") if isinstance(request.data , dict) else None
+		if not isinstance(operations , list) or not operations:
+			raise ValidationError({"operations": "Must be a non-empty list."})
+		if len(operations) > self.batch_limit:
+			raise ValidationError({"operations": f"At most {self.batch_limit} operations per request."})
+		
+		parsed = []
+		for index , operation in enumerate(operations):
+			try:
+				op = operation["op"]
+				product_id = int(operation["product"])
+				quantity = int(operation.get("quantity" , 0 if op == "remove" else 1))
+			except (TypeError , KeyError , ValueError , AttributeError):
+				raise ValidationError({"operations": f"Operation {index}: needs an op and an integer product and quantity."})
+			if op not in ("set" , "increment" , "remove"):
+				raise ValidationError({"operations": f"Operation {index}: op must be set, increment or remove."})
+			if quantity < (1 if op == "increment" else 0):
+				raise ValidationError({"operations": f"Operation {index}: quantity is too small."})
+			parsed.append((op , product_id , quantity))
+		return parsed
+
+
+class CartViewSet(CartOperationsMixin , QueryPlanMixin , viewsets.ModelViewSet):
 	serializer_class = CartSerializer
 	permission_classes = [permissions.IsAuthenticated]
 	
 	def get_queryset(self):
-		return (
-			Cart.objects
-			.filter(user=self.request.user)
-			.select_related("product")
-			.prefetch_related("product__images")
-		)
+		return Cart.objects.filter(user=self.request.user)
 	
-	# Add total price for list API
 	def list(self , request , *args , **kwargs):
-		queryset = self.get_queryset()
-		serializer = self.get_serializer(queryset , many=True)
-		
-		total_amount = sum(
-			item.product.selling_price * item.quantity
-			for item in queryset
-		)
+		return self.summary_response(request)
+	
+	# Lines and cart totals from one windowed query (see CartQuerySet.with_totals)
+	def summary_response(self , request):
+		queryset = self.filter_queryset(self.get_queryset().with_totals())
+		items = list(queryset)
+		first = items[0] if items else None
 		
 		return Response({
-			"count": queryset.count() ,
-			"total_amount": total_amount ,
-			"results": serializer.data
+			"count": first.cart_count if first else 0 ,
+			"total_amount": first.cart_subtotal if first else 0 ,
+			"savings": first.cart_savings if first else 0 ,
+			"results": self.get_serializer(items , many=True).data
 		})
 	
-	# Add-to-cart logic (avoid duplicates)
+	# Add-to-cart: one atomic upsert that also checks stock (see CartQuerySet.add)
 	def create(self , request , *args , **kwargs):
-		user = request.user
-		product_id = request.data.get("product")
-		quantity = int(request.data.get("quantity" , 1))
-		
-		if not product_id:
+		if not request.data.get("product"):
 			return Response({"error": "Product is required"} , status=400)
+		try:
+			product_id = int(request.data.get("product"))
+			quantity = int(request.data.get("quantity" , 1))
+		except (TypeError , ValueError):
+			return Response({"error": "Product and quantity must be integers"} , status=400)
+		if quantity < 1:
+			return Response({"error": "Quantity must be at least 1"} , status=400)
 		
-		existing_item = Cart.objects.filter(
-			user=user ,
-			product_id=product_id
-		).first()
+		try:
+			item , created = Cart.objects.add(request.user , product_id , quantity)
+		except InsufficientStock as error:
+			return Response({"error": str(error) , "available": error.available} , status=400)
+		return Response(self.get_serializer(item).data , status=201 if created else 200)
+	
+	# Reorders, wishlist merges and bulk edits in one round-trip:
+	# POST {"operations": [{"op": "set" | "increment" | "remove", "product": id, "quantity": n}, ...]}
+	# Applied all-or-nothing (see CartQuerySet.apply); answers with the cart summary
+	@action(detail=False , methods=["post"])
+	def batch(self , request):
+		errors = Cart.objects.apply(request.user , self.get_batch_operations(request))
+		if errors:
+			return Response({"errors": errors} , status=400)
+		return self.summary_response(request)
+
+
+class GuestCartView(CartOperationsMixin , APIView):
+	"""
+	Cart for anonymous visitors, kept in the cache rather than the cart table
+	(see core.guest_cart). POST /guest-cart/ with operations starts one and
+	returns its token; login and registration merge it given {"guest_cart": token}.
+	"""
+	permission_classes = [permissions.AllowAny]
+	
+	def get(self , request , token):
+		lines = guest_cart.load(token)
+		if lines is None:
+			return Response({"error": "Guest cart not found"} , status=404)
+		return self.summary_response(request , token , lines)
+	
+	def post(self , request , token=None):
+		operations = self.get_batch_operations(request)
+		created = token is None
+		if created:
+			token , current = guest_cart.new_token() , {}
+		else:
+			current = guest_cart.load(token)
+			if current is None:
+				return Response({"error": "Guest cart not found"} , status=404)
 		
-		if existing_item:
-			existing_item.quantity += quantity
-			existing_item.save()
-			return Response(self.get_serializer(existing_item).data , status=200)
+		final = fold_cart_operations(current , operations)
+		errors = Cart.objects.batch_errors(final , current)
+		if sum(1 for quantity in final.values() if quantity) > self.batch_limit:
+			errors.append({"error": f"A guest cart holds at most {self.batch_limit} products."})
+		if errors:
+			return Response({"errors": errors} , status=400)
 		
-		return super().create(request , *args , **kwargs)
+		lines = guest_cart.save(token , final)
+		return self.summary_response(request , token , lines , status_code=201 if created else 200)
 	
-	def perform_create(self , serializer):
-		serializer.save(user=self.request.user)
-
-
-class WishlistViewSet(viewsets.ModelViewSet):
+	def delete(self , request , token):
+		guest_cart.delete(token)
+		return Response(status=204)
+	
+	def summary_response(self , request , token , lines , status_code=200):
+		products = Product.objects.prefetch_related("images").in_bulk(list(lines))
+		items = [
+			Cart(product=products[product_id] , quantity=quantity)
+			for product_id , quantity in lines.items() if product_id in products
+		]
+		priced = [item for item in items if item.product.selling_price is not None]
+		
+		return Response({
+			"token": token ,
+			"count": len(items) ,
+			"total_amount": sum(item.product.selling_price * item.quantity for item in priced) ,
+			"savings": sum(
+				(item.product.base_price - item.product.selling_price) * item.quantity
+				for item in priced
+				if item.product.base_price is not None and item.product.base_price > item.product.selling_price
+			) ,
+			"results": CartSerializer(items , many=True , context={"request": request}).data
+		} , status=status_code)
+
+
+class WishlistViewSet(QueryPlanMixin , viewsets.ModelViewSet):
 	serializer_class = WishlistSerializer
 	permission_classes = [permissions.IsAuthenticated]
 	
@@ -195,21 +490,20 @@ class WishlistViewSet(viewsets.ModelViewSet):
 		serializer.save(user=self.request.user)
 
 
-class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderViewSet(ModifiedConditionalMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	serializer_class = OrderSerializer
 	permission_classes = [permissions.IsAuthenticated]
+	pagination_class = OrderPagination
 	
 	def get_queryset(self):
-		return (
-			Order.objects.filter(user=self.request.user)
-			.prefetch_related("items__product")
-			.select_related("address")
-		)
+		return Order.objects.filter(user=self.request.user)
 
 
-class OrderItemViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderItemViewSet(ModifiedConditionalMixin , QueryPlanMixin , viewsets.ReadOnlyModelViewSet):
 	serializer_class = OrderItemSerializer
 	permission_classes = [permissions.IsAuthenticated]
+	pagination_class = OrderItemPagination
+	last_modified_field = "order__updated_at"
 	
 	def get_queryset(self):
 		return OrderItem.objects.filter(order__user=self.request.user)